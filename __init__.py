@@ -99,6 +99,7 @@ class CatalogPLPlugin:
     self.iface.removePluginMenu( self.name, self.action )
     self.iface.removeToolBarIcon( self.action )
     del self.action
+    self.ctl.downloadManager.finish() # Thread of writer, CatalogPL.__del__ is not called by cycle of references
     del self.ctl
   
   @QtCore.pyqtSlot()
@@ -19,15 +19,18 @@ email                : motta.luiz@gmail.com
  ***************************************************************************/
 """
 
-import json, datetime
+import os, json, datetime, re, math, copy, collections, time, random, heapq
 
 from PyQt4 import QtCore, QtGui, QtNetwork
 
+from writerfiles import WorkerWriteFiles
+
 class AccessSite(QtCore.QObject):
 
   # Signals
   finished = QtCore.pyqtSignal( dict)
   send_data = QtCore.pyqtSignal(QtCore.QByteArray)
+  send_headers = QtCore.pyqtSignal(dict)
   status_download = QtCore.pyqtSignal(int, int)
   status_erros = QtCore.pyqtSignal(list)
   
@@ -42,22 +45,26 @@ class AccessSite(QtCore.QObject):
     501: 'Not implemented',
     502: 'Bad Gateway'  
   }
+  readBufferSize = 4 * 1024 * 1024 # Bytes of reply by send_data, limit of reads while paused
 
-  def __init__(self):
+  def __init__(self, networkAccess=None):
     super( AccessSite, self ).__init__()
-    self.networkAccess = QtNetwork.QNetworkAccessManager(self)
-    self.totalReady = self.reply = self.triedAuthentication = self.isKilled = None
+    # A shared networkAccess has replies of others AccessSite, see replyFinished
+    self.networkAccess = QtNetwork.QNetworkAccessManager(self) if networkAccess is None else networkAccess
+    self.totalReady = self.reply = self.triedAuthentication = self.isKilled = self.sentHeaders = None
+    self.isPaused = False
     # Input by self.run
-    self.credential = self.responseAllFinished = None
+    self.credential = self.responseAllFinished = self.headers = None
 
-  def run(self, url, credential=None, responseAllFinished=True, json_request=None):
+  def run(self, url, credential=None, responseAllFinished=True, json_request=None, headers=None):
     if credential is None:
       credential = {'user': '', 'password': ''}
     ( self.credential, self.responseAllFinished ) = ( credential, responseAllFinished )
+    self.headers = {} if headers is None else headers # Raw headers, also for redirection
     self._connect()
     self.totalReady = 0
-    self.isKilled = False
-    request = QtNetwork.QNetworkRequest( url )
+    self.isKilled = self.sentHeaders = False
+    request = self._getRequest( url )
     if json_request is None:
       reply = self.networkAccess.get( request )
     else:
@@ -72,10 +79,21 @@ class AccessSite(QtCore.QObject):
 
     self.triedAuthentication = False
     self.reply = reply
+    self._setReadBuffer()
     self._connectReply()
   
   def kill(self):
     self.isKilled = True
+
+  def pause(self, isPaused):
+    # Backpressure: while paused the reply is not read( readBufferSize )
+    self.isPaused = isPaused
+    if not isPaused and not self.reply is None and self.reply.bytesAvailable() > 0:
+      self.readyRead()
+
+  def _setReadBuffer(self):
+    if not self.responseAllFinished:
+      self.reply.setReadBufferSize( AccessSite.readBufferSize )
   
   def isRunning(self):
     return ( not self.reply is None and self.reply.isRunning() )  
@@ -119,7 +137,7 @@ class AccessSite(QtCore.QObject):
     if url.isRelative():
       url = url.resolved( url )
 
-    request = QtNetwork.QNetworkRequest( url )
+    request = self._getRequest( url )
     reply = self.networkAccess.get( request )
     if reply is None:
       response = { 'isOk': False, 'message': "Netwok error", 'errorCode': -1 }
@@ -128,21 +146,56 @@ class AccessSite(QtCore.QObject):
       return
 
     self.reply = reply
+    self._setReadBuffer()
     self._connectReply()
     
+  def _getRequest(self, url):
+    request = QtNetwork.QNetworkRequest( url )
+    for item in self.headers.iteritems():
+      request.setRawHeader( item[0], item[1] )
+    return request
+
+  def _sendHeaders(self, reply):
+    # Once, before data, for downloads that depend on the response( range, validators )
+    if self.sentHeaders:
+      return
+    self.sentHeaders = True
+    headers = {
+      'statusCode': reply.attribute( QtNetwork.QNetworkRequest.HttpStatusCodeAttribute ),
+      'etag': str( reply.rawHeader('ETag') ),
+      'lastModified': str( reply.rawHeader('Last-Modified') ),
+      'acceptRanges': str( reply.rawHeader('Accept-Ranges') ),
+      'contentRange': str( reply.rawHeader('Content-Range') )
+    }
+    self.send_headers.emit( headers )
+
+  def _getStatusError(self, reply):
+    # HTTP status and 'Retry-After'( seconds ), used for retry of requests
+    retryAfter = str( reply.rawHeader('Retry-After') ).strip()
+    return {
+      'statusCode': reply.attribute( QtNetwork.QNetworkRequest.HttpStatusCodeAttribute ),
+      'retryAfter': int( retryAfter ) if retryAfter.isdigit() else None
+    }
+
   def _errorCodeAttribute(self, code):
     msg = 'Error network' if not code in self.ErrorCodeAttribute.keys() else AccessSite.ErrorCodeAttribute[ code ]
     response = { 'isOk': False, 'message': msg, 'errorCode': code }
+    response.update( self._getStatusError( self.reply ) )
     self._clearConnect()
     self.finished.emit( response )
 
   @QtCore.pyqtSlot(QtNetwork.QNetworkReply)
   def replyFinished(self, reply) :
+    if not reply is self.reply:
+      return
+
     if self.isKilled:
       self._errorCodeAttribute(10)
+      return
 
     if reply.error() != QtNetwork.QNetworkReply.NoError :
       response = { 'isOk': False, 'message': reply.errorString(), 'errorCode': reply.error() }
+      response.update( self._getStatusError( reply ) )
       self._clearConnect()
       self.finished.emit( response )
       return
@@ -153,7 +206,7 @@ class AccessSite(QtCore.QObject):
       return
 
     codeAttribute = reply.attribute( QtNetwork.QNetworkRequest.HttpStatusCodeAttribute )
-    if codeAttribute != 200:
+    if not codeAttribute in ( 200, 206 ): # 206: partial content by 'Range'
       self._errorCodeAttribute( codeAttribute )
       return
 
@@ -168,6 +221,11 @@ class AccessSite(QtCore.QObject):
     if self.responseAllFinished:
       response[ 'data' ] = reply.readAll()
     else:
+      self._sendHeaders( reply )
+      if reply.bytesAvailable() > 0:
+        data = reply.readAll()
+        self.totalReady += len( data )
+        self.send_data.emit( data )
       response[ 'totalReady' ] = self.totalReady
 
     self._clearConnect()
@@ -175,6 +233,8 @@ class AccessSite(QtCore.QObject):
 
   @QtCore.pyqtSlot(QtNetwork.QNetworkReply, QtNetwork.QAuthenticator)
   def authenticationRequired (self, reply, authenticator):
+    if not reply is self.reply:
+      return
     if not self.triedAuthentication: 
       authenticator.setUser( self.credential['user'] ) 
       authenticator.setPassword( self.credential['password'] )
@@ -188,7 +248,7 @@ class AccessSite(QtCore.QObject):
       self._errorCodeAttribute(10)
       return
 
-    if self.responseAllFinished:
+    if self.responseAllFinished or self.isPaused:
       return
 
     urlRedir = self.reply.attribute( QtNetwork.QNetworkRequest.RedirectionTargetAttribute )
@@ -197,10 +257,11 @@ class AccessSite(QtCore.QObject):
       return
 
     codeAttribute = self.reply.attribute( QtNetwork.QNetworkRequest.HttpStatusCodeAttribute )
-    if codeAttribute != 200:
+    if not codeAttribute in ( 200, 206 ):
       self._errorCodeAttribute( codeAttribute )
       return
 
+    self._sendHeaders( self.reply )
     data = self.reply.readAll()
     if data is None:
       return
@@ -221,6 +282,77 @@ class AccessSite(QtCore.QObject):
     self.reply.ignoreSslErrors()
 
 
+class StreamJSON(object):
+  # Objects of 'keyArray' returned by feed while downloading, the other keys by finish
+
+  reToken = re.compile( r'["{}\[\]]' )
+  reEndString = re.compile( r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL )
+
+  def __init__(self, keyArray='features'):
+    self.keyArray = keyArray
+    self.buffer = '' # Text not consumed
+    self.head = [] # Text outside of keyArray
+    self.pos = self.depth = 0
+    self.lastKey = self.startItem = None
+    self.inArray = False
+
+  def feed(self, data):
+    items = []
+    buff = self.buffer + data
+    ( pos, start ) = ( self.pos, 0 )
+    while True:
+      m = self.reToken.search( buff, pos )
+      if m is None:
+        pos = len( buff )
+        break
+      ( c, i ) = ( m.group(), m.start() )
+      if c == '"':
+        e = self.reEndString.match( buff, i + 1 )
+        if e is None: # Incomplete string, wait next data
+          pos = i
+          break
+        if self.depth == 1:
+          self.lastKey = buff[ i+1 : e.end()-1 ]
+        pos = e.end()
+        continue
+      pos = i + 1
+      if c in '{[':
+        self.depth += 1
+        if self.inArray and self.depth == 3:
+          self.startItem = i
+        elif c == '[' and self.depth == 2 and self.lastKey == self.keyArray:
+          self.inArray = True
+          self.head.append( buff[ start : pos ] )
+      else:
+        self.depth -= 1
+        if self.inArray and self.depth == 2:
+          items.append( json.loads( buff[ self.startItem : pos ] ) )
+          self.startItem = None
+        elif self.inArray and self.depth == 1:
+          self.inArray = False
+          start = i # Keep end of array
+
+    if self.inArray:
+      keep = pos if self.startItem is None else self.startItem
+    else:
+      self.head.append( buff[ start : pos ] )
+      keep = pos
+    self.buffer = buff[ keep : ]
+    self.pos = pos - keep
+    if not self.startItem is None:
+      self.startItem -= keep
+
+    return items
+
+  def finish(self):
+    if self.depth != 0 or self.inArray:
+      raise ValueError("Incomplete JSON response")
+    text = ''.join( self.head ) + self.buffer
+    del self.head[:]
+    self.buffer = ''
+    return json.loads( text )
+
+
 class API_PlanetLabs(QtCore.QObject):
 
   errorCodeLimitOK = (201, 207) # https://en.wikipedia.org/wiki/List_of_HTTP_status_codes (2107-09-30)
@@ -234,10 +366,16 @@ class API_PlanetLabs(QtCore.QObject):
   urlThumbnail = "https://api.planet.com/data/v1/item-types/{item_type}/items/{item_id}/thumb"
   urlTMS = "https://tiles.planet.com/data/v1/{item_type}/{item_id}/{{z}}/{{x}}/{{y}}.png"
   urlAssets = "https://api.planet.com/data/v1/item-types/{item_type}/items/{item_id}/assets" 
-
-  def __init__(self):
+  cacheHtml = collections.OrderedDict() # 'meta_json' -> HTML, see getHtmlMetadata
+  totalCacheHtml = 100
+  cacheMetadata = collections.OrderedDict() # ( feature id, hash of 'meta_json' ) -> dict, see getValueCache
+  totalCacheMetadata = 1000
+  cacheValues = collections.OrderedDict() # ( feature id, hash of 'meta_json', keys ) -> ( success, value )
+  totalCacheValues = 100000
+
+  def __init__(self, networkAccess=None):
     super( API_PlanetLabs, self ).__init__()
-    self.access = AccessSite()
+    self.access = AccessSite( networkAccess )
     self.currentUrl = None
 
   def _clearResponse(self, response):
@@ -246,6 +384,38 @@ class API_PlanetLabs(QtCore.QObject):
       del response[ 'data' ]
     del response[ 'statusRequest' ]
 
+  def _runJSON(self, url, setFinished, setScenes=None, json_request=None):
+    # Parse while downloading: 'features' are sent to setScenes( or response['scenes'] ) and the others keys in response['json']
+    @QtCore.pyqtSlot(QtCore.QByteArray)
+    def sendData(data):
+      scenes = stream.feed( str( data ) )
+      if len( scenes ) == 0:
+        return
+      if setScenes is None:
+        allScenes.extend( scenes )
+      else:
+        setScenes( scenes )
+
+    @QtCore.pyqtSlot(dict)
+    def finished( response ):
+      self.access.finished.disconnect( finished )
+      self.access.send_data.disconnect( sendData )
+      if response['isOk']:
+        try:
+          response[ 'json' ] = stream.finish()
+          response[ 'scenes' ] = allScenes
+        except ValueError as e:
+          response = { 'isOk': False, 'message': "Invalid response({0})".format( e ), 'errorCode': -1 }
+
+      setFinished( response )
+
+    stream = StreamJSON()
+    allScenes = []
+    self.access.finished.connect( finished )
+    self.access.send_data.connect( sendData )
+    credential = { 'user': API_PlanetLabs.validKey, 'password': ''}
+    self.access.run( url, credential, False, json_request )
+
   def kill(self):
     self.access.kill()
 
@@ -290,46 +460,34 @@ class API_PlanetLabs(QtCore.QObject):
     credential = { 'user': key, 'password': ''}
     self.access.run( url, credential )
 
-  def getUrlScenes(self, json_request, setFinished):
-    @QtCore.pyqtSlot(dict)
+  def getUrlScenes(self, json_request, setFinished, setScenes=None):
     def finished( response):
-      self.access.finished.disconnect( finished )
       if response[ 'isOk' ]:
-        data = json.loads( str( response['data'] ) )
-        response[ 'url_scenes' ] = data['_links']['_self']
-        response['total'] = len( data['features'] )
-        
-        data.clear()
+        response[ 'url' ] = response[ 'json' ][ '_links' ].get( '_next' )
+        del response[ 'json' ] # 'scenes' is the first page
         self._clearResponse( response )
 
       setFinished( response )
 
     self.currentUrl = API_PlanetLabs.urlQuickSearch
     url = QtCore.QUrl( self.currentUrl )
-    self.access.finished.connect( finished )
-    credential = { 'user': API_PlanetLabs.validKey, 'password': ''}
-    self.access.run( url, credential, json_request=json_request )
+    self._runJSON( url, finished, setScenes, json_request )
 
-  def getScenes(self, url, setFinished):
-    @QtCore.pyqtSlot(dict)
+  def getScenes(self, url, setFinished, setScenes=None):
+    # setScenes: receive the features while downloading
     def finished( response):
-      self.access.finished.disconnect( finished )
       if response[ 'isOk' ]:
-        data = json.loads( str( response[ 'data' ] ) )
-        response[ 'url' ] = data[ '_links' ][ '_next' ]
-        response[ 'scenes' ] = data[ 'features' ]
+        response[ 'url' ] = response[ 'json' ][ '_links' ].get( '_next' )
+        del response[ 'json' ]
         self._clearResponse( response )
 
       setFinished( response )
 
     self.currentUrl = url
     url = QtCore.QUrl.fromEncoded( url )
-    self.access.finished.connect( finished )
-    credential = { 'user': API_PlanetLabs.validKey, 'password': '' }
-    self.access.run( url, credential )
+    self._runJSON( url, finished, setScenes )
 
   def getAssetsStatus(self, item_type, item_id, setFinished):
-    @QtCore.pyqtSlot(dict)
     def finished( response):
       def setStatus(asset):
         def getDateTimeFormat(d):
@@ -354,8 +512,9 @@ class API_PlanetLabs(QtCore.QObject):
             r['activate'] = data[ asset ]['_links']['activate']
         if data[ asset ].has_key('location'):
           r['location'] = data[ asset ]['location']
+        if data[ asset ].get('md5_digest'):
+          r['md5'] = data[ asset ]['md5_digest']
 
-      self.access.finished.disconnect( finished )
       if response[ 'isOk' ]:
         formatDateTime = '%Y-%m-%d %H:%M:%S'
         date_time = datetime.datetime.now().strftime( formatDateTime )
@@ -363,9 +522,11 @@ class API_PlanetLabs(QtCore.QObject):
           'date_calculate': date_time,
           'url': self.currentUrl
         }
-        data = json.loads( str( response[ 'data' ] ) )
+        data = response[ 'json' ]
         setStatus('analytic')
         setStatus('udm') 
+        del response[ 'json' ]
+        del response[ 'scenes' ]
         self._clearResponse( response )
 
       setFinished( response )
@@ -373,10 +534,7 @@ class API_PlanetLabs(QtCore.QObject):
     url = API_PlanetLabs.urlAssets.format(item_type=item_type, item_id=item_id)
     self.currentUrl = url
     url = QtCore.QUrl.fromEncoded( url )
-
-    self.access.finished.connect( finished )
-    credential = { 'user': API_PlanetLabs.validKey, 'password': ''}
-    self.access.run( url, credential )
+    self._runJSON( url, finished )
 
   def getThumbnail(self, item_id, item_type, setFinished):
     @QtCore.pyqtSlot(dict)
@@ -411,10 +569,15 @@ class API_PlanetLabs(QtCore.QObject):
     credential = { 'user': API_PlanetLabs.validKey, 'password': ''}
     self.access.run( url, credential )
     
-  def saveImage(self, url, setFinished, setSave, setProgress):
+  def saveImage(self, url, setFinished, setSave, setProgress, headers=None, setHeaders=None):
+    # headers: raw headers of request( 'Range' ), setHeaders( dict ) is called before the data
     @QtCore.pyqtSlot(dict)
     def finished( response ):
       self.access.finished.disconnect( finished )
+      self.access.send_data.disconnect( setSave )
+      self.access.status_download.disconnect( setProgress )
+      if not setHeaders is None:
+        self.access.send_headers.disconnect( setHeaders )
       if response['isOk']:
         self._clearResponse( response )
       setFinished( response ) # response[ 'totalReady' ]
@@ -423,8 +586,10 @@ class API_PlanetLabs(QtCore.QObject):
     self.access.finished.connect( finished )
     self.access.send_data.connect( setSave )
     self.access.status_download.connect( setProgress )
+    if not setHeaders is None:
+      self.access.send_headers.connect( setHeaders )
     credential = { 'user': API_PlanetLabs.validKey, 'password': ''}
-    self.access.run( url, credential, False )
+    self.access.run( url, credential, False, None, headers )
 
   @staticmethod
   def getUrlFilterScenesOrtho(filters):
@@ -458,6 +623,29 @@ class API_PlanetLabs(QtCore.QObject):
 
     return ( True, value ) if msgError is None else ( False, msgError ) 
 
+  @staticmethod
+  def getValueCache(fid, jsonMetadataFeature, keys):
+    # As getValue, keep the last values and 'meta_json' parsed by feature( keys is tuple )
+    def getLastUsed(cache, key, total, getValue):
+      value = cache.pop( key, None )
+      if value is None:
+        value = getValue()
+        if len( cache ) >= total:
+          cache.popitem( last=False )
+      cache[ key ] = value
+      return value
+
+    def getMetadata():
+      return json.loads( jsonMetadataFeature )
+
+    def getValue():
+      arg = ( API_PlanetLabs.cacheMetadata, keyFeature, API_PlanetLabs.totalCacheMetadata, getMetadata )
+      return API_PlanetLabs.getValue( getLastUsed( *arg ), list( keys ) )
+
+    keyFeature = ( fid, hash( jsonMetadataFeature ) )
+    arg = ( API_PlanetLabs.cacheValues, keyFeature + ( keys, ), API_PlanetLabs.totalCacheValues, getValue )
+    return getLastUsed( *arg )
+
   @staticmethod
   def getTextTreeMetadata( jsonMetadataFeature ):
     def fill_item(strLevel, value):
@@ -492,16 +680,35 @@ class API_PlanetLabs(QtCore.QObject):
 
   @staticmethod
   def getHtmlTreeMetadata(value, html):
-    if isinstance( value, dict ):
-      html += "<ul>"
+    def addItems(value):
+      items.append("<ul>")
       for key, val in sorted( value.iteritems() ):
         if not isinstance( val, dict ):
-          html += "<li>%s: %s</li> " % ( key, val )
+          items.append( "<li>%s: %s</li> " % ( key, val ) )
         else:
-          html += "<li>%s</li> " % key
-        html = API_PlanetLabs.getHtmlTreeMetadata( val, html )
-      html += "</ul>"
+          items.append( "<li>%s</li> " % key )
+          addItems( val )
+      items.append("</ul>")
+
+    if not isinstance( value, dict ):
       return html
+    items = [ html ]
+    addItems( value )
+    return ''.join( items )
+
+  @staticmethod
+  def getHtmlMetadata(meta_json):
+    # HTML of 'meta_json', keep the last renders
+    cache = API_PlanetLabs.cacheHtml
+    html = cache.pop( meta_json, None )
+    if html is None:
+      try:
+        html = API_PlanetLabs.getHtmlTreeMetadata( json.loads( meta_json ), '' )
+      except ( TypeError, ValueError ):
+        html = ''
+      if len( cache ) >= API_PlanetLabs.totalCacheHtml:
+        cache.popitem( last=False )
+    cache[ meta_json ] = html # Most recently used
     return html
 
   @staticmethod
@@ -582,7 +789,847 @@ class API_PlanetLabs(QtCore.QObject):
     return tw
 
   @staticmethod
-  def getURL_TMS(feat, sbands):
-    ( ok, item_type ) = API_PlanetLabs.getValue( feat['meta_json'], [ 'item_type' ] )
-    url = API_PlanetLabs.urlTMS.format( item_type=item_type, item_id=feat['id'] )
+  def getURL_TMS(item_type, item_id):
+    url = API_PlanetLabs.urlTMS.format( item_type=item_type, item_id=item_id )
     return url
+
+
+class PagerScenes(QtCore.QObject):
+
+  # Signals
+  scenes_ready = QtCore.pyqtSignal()
+
+  def __init__(self, apiPL, depth=2):
+    super( PagerScenes, self ).__init__()
+    ( self.apiPL, self.depth ) = ( apiPL, depth ) # depth: Total of pages fetched before ingested( 0 = serial )
+    self.batches = [] # Scenes parsed while downloading: { 'isOk', 'scenes', 'endPage' }
+    self.pagesAhead = 0 # Pages downloaded and not ingested
+    self.url = self.json_request = self.isFetching = None # Set by start
+
+  def _fetch(self, force=False):
+    def setScenes(scenes):
+      self.batches.append( { 'isOk': True, 'scenes': scenes, 'endPage': False } )
+      self.scenes_ready.emit()
+
+    def setFinished(response):
+      self.isFetching = False
+      self.url = response['url'] if response['isOk'] else None
+      response['endPage'] = True # 'scenes' sent by setScenes
+      self.batches.append( response )
+      self.pagesAhead += 1
+      self._fetch() # Next page while this page is ingested
+      self.scenes_ready.emit()
+
+    if self.isFetching or not ( self.url or self.json_request ):
+      return
+    if not force and self.pagesAhead >= self.depth:
+      return
+    self.isFetching = True
+    if not self.json_request is None: # First page
+      ( json_request, self.json_request ) = ( self.json_request, None )
+      self.apiPL.getUrlScenes( json_request, setFinished, setScenes )
+      return
+    self.apiPL.getScenes( self.url, setFinished, setScenes )
+
+  def _wait(self):
+    loop = QtCore.QEventLoop()
+    self.scenes_ready.connect( loop.quit )
+    loop.exec_()
+    self.scenes_ready.disconnect( loop.quit )
+
+  def start(self, url, firstPage=None, json_request=None):
+    # json_request: the first page is requested by quick-search
+    ( self.url, self.json_request, self.isFetching ) = ( url, json_request, False )
+    del self.batches[:]
+    self.pagesAhead = 0
+    if not firstPage is None:
+      firstPage['endPage'] = True # Response of getUrlScenes
+      self.batches.append( firstPage )
+      self.pagesAhead = 1
+    self._fetch()
+
+  def nextScenes(self):
+    # Scenes downloaded( wait if not have ) or None when finished
+    if len( self.batches ) == 0:
+      self._fetch( True )
+      if not self.isFetching:
+        return None
+      self._wait()
+
+    response = { 'isOk': True, 'scenes': [] }
+    while len( self.batches ) > 0:
+      batch = self.batches[0]
+      if not batch['isOk'] and len( response['scenes'] ) > 0:
+        break
+      self.batches.pop( 0 )
+      if batch['endPage']:
+        self.pagesAhead -= 1
+      if not batch['isOk']:
+        response = batch
+        break
+      response['scenes'].extend( batch['scenes'] )
+    self._fetch()
+    return response
+
+  def hasScenes(self):
+    return len( self.batches ) > 0
+
+  def requestNext(self):
+    # Request the next page when nothing was downloaded( depth = 0 )
+    if len( self.batches ) == 0:
+      self._fetch( True )
+
+  def isFinished(self):
+    return len( self.batches ) == 0 and not self.isFetching and not ( self.url or self.json_request )
+
+  def kill(self):
+    self.apiPL.kill()
+
+  def finish(self):
+    self.url = self.json_request = None
+    if self.isFetching:
+      self.apiPL.kill()
+      while self.isFetching:
+        self._wait()
+    del self.batches[:]
+
+
+class ShardsScenes(QtCore.QObject):
+  # Pagers of shards running concurrently, scenes without repeated 'id'( APIs owned by caller )
+
+  formatDate = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+  def __init__(self, apis, depth=2):
+    super( ShardsScenes, self ).__init__()
+    self.idles = [ PagerScenes( api, depth ) for api in apis ]
+    self.actives = []
+    self.requests = []
+    self.ids = set()
+
+  def _startShards(self):
+    while len( self.idles ) > 0 and len( self.requests ) > 0:
+      pager = self.idles.pop()
+      pager.start( None, json_request=self.requests.pop( 0 ) )
+      self.actives.append( pager )
+
+  def _wait(self):
+    loop = QtCore.QEventLoop()
+    for pager in self.actives:
+      pager.requestNext()
+      pager.scenes_ready.connect( loop.quit )
+    loop.exec_()
+    for pager in self.actives:
+      pager.scenes_ready.disconnect( loop.quit )
+
+  @staticmethod
+  def getRequests(json_request, tileSize, sliceDays):
+    # Requests by tiles( degrees ) of GeometryFilter and slices( days ) of DateRangeFilter
+    def getFilter(typeFilter):
+      filters = [ f for f in json_request['filter']['config'] if f['type'] == typeFilter ]
+      return None if len( filters ) == 0 else filters[0]
+
+    def getTiles():
+      coords = [ c for ring in geometryFilter['config']['coordinates'] for c in ring ]
+      ( xmin, xmax ) = ( min( c[0] for c in coords ), max( c[0] for c in coords ) )
+      ( ymin, ymax ) = ( min( c[1] for c in coords ), max( c[1] for c in coords ) )
+      nx = max( 1, int( math.ceil( ( xmax - xmin ) / tileSize ) ) )
+      ny = max( 1, int( math.ceil( ( ymax - ymin ) / tileSize ) ) )
+      if nx * ny == 1:
+        return [ geometryFilter['config'] ]
+      ( dx, dy ) = ( ( xmax - xmin ) / nx, ( ymax - ymin ) / ny )
+      tiles = []
+      for i in xrange( nx ):
+        for j in xrange( ny ):
+          ( x1, y1 ) = ( xmin + i * dx, ymin + j * dy )
+          ( x2, y2 ) = ( xmax if i == nx - 1 else x1 + dx, ymax if j == ny - 1 else y1 + dy )
+          ring = [ [ x1, y1 ], [ x2, y1 ], [ x2, y2 ], [ x1, y2 ], [ x1, y1 ] ]
+          tiles.append( { 'type': 'Polygon', 'coordinates': [ ring ] } )
+      return tiles
+
+    def getSlices():
+      config = dateFilter['config']
+      ( d1, d2 ) = map( lambda d: datetime.datetime.strptime( d[:19], '%Y-%m-%dT%H:%M:%S' ), ( config['gte'], config['lte'] ) )
+      delta = datetime.timedelta( days=sliceDays )
+      if d2 - d1 <= delta:
+        return [ config ]
+      slices = []
+      while d1 < d2:
+        d = min( d1 + delta, d2 )
+        slices.append( { 'gte': d1.strftime( ShardsScenes.formatDate ), 'lte': d.strftime( ShardsScenes.formatDate ) } )
+        d1 = d
+      slices[0]['gte'], slices[-1]['lte'] = config['gte'], config['lte']
+      return slices
+
+    geometryFilter = getFilter('GeometryFilter')
+    dateFilter = getFilter('DateRangeFilter')
+    tiles = [ None ] if geometryFilter is None else getTiles()
+    slices = [ None ] if dateFilter is None else getSlices()
+    if len( tiles ) * len( slices ) == 1:
+      return [ json_request ]
+
+    requests = []
+    for tile in tiles:
+      for dates in slices:
+        request = copy.deepcopy( json_request )
+        for f in request['filter']['config']:
+          if f['type'] == 'GeometryFilter':
+            f['config'] = tile
+          elif f['type'] == 'DateRangeFilter':
+            f['config'] = dates
+        requests.append( request )
+    return requests
+
+  def start(self, requests):
+    self.requests = list( requests )
+    self.ids.clear()
+    self._startShards()
+
+  def nextScenes(self):
+    # Scenes downloaded( wait if not have ) or None when finished
+    while len( self.actives ) > 0:
+      for pager in list( self.actives ):
+        if pager.hasScenes():
+          self.actives.remove( pager ) # Next call starts by other shards
+          self.actives.append( pager )
+          response = pager.nextScenes()
+          if response['isOk']:
+            scenes = [ item for item in response['scenes'] if not item['id'] in self.ids ]
+            self.ids.update( item['id'] for item in scenes )
+            response['scenes'] = scenes
+          return response
+        if pager.isFinished():
+          self.actives.remove( pager )
+          self.idles.append( pager )
+          self._startShards()
+      if len( self.actives ) > 0 and not any( pager.hasScenes() for pager in self.actives ):
+        self._wait()
+    return None
+
+  def kill(self):
+    for pager in self.actives:
+      pager.kill()
+
+  def finish(self):
+    del self.requests[:]
+    for pager in self.actives:
+      pager.finish()
+    self.idles.extend( self.actives )
+    del self.actives[:]
+
+
+class SchedulerActivate(QtCore.QObject):
+  # Activation under rate limit( token bucket ), 429 and 5xx are retried with backoff until deadline
+
+  finished = QtCore.pyqtSignal()
+  rate = 2.0 # Requests by second
+  burst = 4 # Tokens of bucket
+  backoffBase, backoffMax = 1.0, 60.0 # Seconds
+  deadline = 900 # Seconds for retry
+
+  def __init__(self, apis):
+    super( SchedulerActivate, self ).__init__()
+    self.apis = apis
+    self.timer = QtCore.QTimer( self )
+    self.timer.setSingleShot( True )
+    self.timer.timeout.connect( self._dispatch )
+    self.idle, self.queue = [], [] # queue: heap of ( time ready, order, item )
+    self.tokens = self.lastRefill = self.pauseUntil = self.setItem = None
+    self.running = self.order = 0
+    self.isKilled = False
+
+  def start(self, items, setItem):
+    # Return False while requests of previous run are in flight
+    if self.running > 0:
+      return False
+    now = time.time()
+    ( self.idle, self.queue, self.setItem ) = ( list( self.apis ), [], setItem )
+    ( self.tokens, self.lastRefill, self.pauseUntil ) = ( float( SchedulerActivate.burst ), now, now )
+    self.isKilled = False
+    self.add( items )
+    return True
+
+  def add(self, items):
+    # Items while running
+    now = time.time()
+    for item in items:
+      item['attempts'] = 0
+      item['deadline'] = now + SchedulerActivate.deadline
+      self._push( now, item )
+    self._dispatch()
+
+  def _push(self, timeReady, item):
+    self.order += 1
+    heapq.heappush( self.queue, ( timeReady, self.order, item ) )
+
+  @QtCore.pyqtSlot()
+  def _dispatch(self):
+    now = time.time()
+    self.tokens = min( float( SchedulerActivate.burst ), self.tokens + ( now - self.lastRefill ) * SchedulerActivate.rate )
+    self.lastRefill = now
+    wait = None
+    while len( self.idle ) > 0 and len( self.queue ) > 0:
+      wait = max( self.queue[0][0], self.pauseUntil ) - now
+      if wait <= 0 and self.tokens < 1.0:
+        wait = ( 1.0 - self.tokens ) / SchedulerActivate.rate
+      if wait > 0:
+        break
+      wait = None
+      self.tokens -= 1.0
+      self._request( self.idle.pop(), heapq.heappop( self.queue )[2] )
+    if not wait is None:
+      self.timer.start( int( wait * 1000 ) + 1 )
+    elif len( self.queue ) == 0 and self.running == 0:
+      self.finished.emit()
+
+  def _request(self, api, item):
+    def setFinished(response):
+      self.running -= 1
+      self.idle.append( api )
+      if not self.isKilled:
+        self._setResponse( item, response )
+        self._dispatch()
+      elif self.running == 0:
+        self.finished.emit()
+
+    self.running += 1
+    item['attempts'] += 1
+    api.activeAsset( item['url'], setFinished )
+
+  def _setResponse(self, item, response):
+    now = time.time()
+    statusCode = response.get('statusCode')
+    isRetry = not response['isOk'] and not statusCode is None and ( statusCode == 429 or statusCode >= 500 )
+    if not isRetry or now > item['deadline']:
+      self.setItem( item, response )
+      return
+    retryAfter = response.get('retryAfter')
+    if not retryAfter is None:
+      delay = float( retryAfter )
+      self.pauseUntil = max( self.pauseUntil, now + delay ) # Quota is shared by all requests
+    else:
+      limit = min( SchedulerActivate.backoffMax, SchedulerActivate.backoffBase * 2 ** item['attempts'] )
+      delay = random.uniform( 0, limit )
+    self._push( now + delay, item )
+
+  def kill(self):
+    self.isKilled = True
+    self.timer.stop()
+    self.queue = []
+    for api in self.apis:
+      api.kill()
+    if self.running == 0:
+      self.finished.emit()
+
+
+class DownloadManager(QtCore.QObject):
+  # Concurrent downloads of images to '.part' files, written by thread( WorkerWriteFiles )
+
+  finished = QtCore.pyqtSignal()
+  queueBytes = 32 * 1024 * 1024 # Bytes waiting for writer, resume reads at half
+  progressInterval = 0.25 # Seconds between updates of progress
+  checksumRetries = 2
+  segments = 4 # Ranges of a file in parallel, include the first
+  segmentSize = 16 * 1024 * 1024 # Bytes of first range, smaller files are one request
+  reContentRange = re.compile( r'bytes\s+\d+-\d+/(\d+)' )
+
+  def __init__(self, apis):
+    super( DownloadManager, self ).__init__()
+    self.apis = apis
+    self.idle, self.queue, self.queueSegments = list( apis ), [], collections.deque() # queue: heap of ( priority, order, item )
+    self.keys = {} # Key of segment in writer: ( transfer, segment ), see _request
+    self.progress = {} # key: ( bytesReceived, bytesTotal ) of running segments
+    self.setItem = self.setProgress = self.journal = None
+    self.running = self.idKey = self.queuedBytes = self.order = 0
+    self.lastProgress = 0.0
+    self.isKilled = self.isPaused = False
+    self.thread = QtCore.QThread( self )
+    self.thread.setObjectName( "QGIS_Plugin_Catalog_PlanetLabs_Writer" )
+    self.writer = WorkerWriteFiles()
+    self.writer.moveToThread( self.thread )
+    self.thread.started.connect( self.writer.run )
+    self.writer.written.connect( self._written )
+    self.writer.closed.connect( self._closed )
+
+  def start(self, items, setItem, setProgress, journal=None):
+    # items: 'url' and 'file', setProgress( received, total ) in kilobytes
+    ( self.setItem, self.setProgress, self.journal ) = ( setItem, setProgress, journal )
+    self.queue = []
+    self.progress = {}
+    self.isKilled = False
+    if not self.thread.isRunning():
+      self.thread.start()
+    self.add( items )
+
+  def add(self, items):
+    # Items while running
+    for item in items:
+      item['queuePriority'] = tuple( item.get( 'priority', () ) )
+      self._push( item )
+    self._dispatch()
+
+  def _push(self, item):
+    self.order += 1
+    heapq.heappush( self.queue, ( item['queuePriority'], self.order, item ) )
+
+  def _dispatch(self):
+    while len( self.idle ) > 0 and ( len( self.queueSegments ) > 0 or len( self.queue ) > 0 ):
+      if len( self.queueSegments ) > 0:
+        ( transfer, segment ) = self.queueSegments.popleft()
+        transfer['segmentsQueued'] -= 1
+        self._requestSegment( self.idle.pop(), transfer, segment )
+        continue
+      item = heapq.heappop( self.queue )[2]
+      if os.path.exists( item['file'] ):
+        self._setItem( item, { 'isOk': True, 'totalReady': 0, 'isExists': True } )
+        continue
+      self._request( self.idle.pop(), item )
+    if len( self.queue ) == 0 and self.running == 0:
+      self.finished.emit()
+
+  @staticmethod
+  def _getValidator(fileValidator):
+    if not os.path.exists( fileValidator ):
+      return None
+    with open( fileValidator ) as f:
+      validator = f.read().strip()
+    return validator if len( validator ) > 0 else None
+
+  @staticmethod
+  def _saveValidator(transfer, headers):
+    validator = headers['etag'] if len( headers['etag'] ) > 0 else headers['lastModified']
+    transfer['validator'] = validator if len( validator ) > 0 else None
+    with open( transfer['fileValidator'], 'w' ) as f:
+      f.write( validator )
+
+  @staticmethod
+  def _getRanges(fileRanges):
+    if not os.path.exists( fileRanges ):
+      return None
+    try:
+      with open( fileRanges ) as f:
+        return json.load( f )
+    except ValueError:
+      return None
+
+  @staticmethod
+  def _saveRanges(transfer):
+    values = { 'size': transfer['size'], 'isParallel': transfer['isParallel'], 'ranges': transfer['ranges'] }
+    with open( transfer['fileRanges'], 'w' ) as f:
+      json.dump( values, f )
+
+  @staticmethod
+  def _addRange(ranges, start, end):
+    # Ranges [ start, end ) written, sorted and merged
+    ranges.append( [ start, end ] )
+    ranges.sort()
+    merged = [ ranges[0] ]
+    for r in ranges[1:]:
+      if r[0] <= merged[-1][1]:
+        merged[-1][1] = max( merged[-1][1], r[1] )
+      else:
+        merged.append( r )
+    ranges[:] = merged
+
+  def _setItem(self, item, response):
+    if not self.journal is None:
+      self.journal.setFinished( item, response )
+    self.setItem( item, response )
+
+  def _request(self, api, item):
+    self.running += 1
+    if not self.journal is None:
+      self.journal.setActive( item )
+    filePart = "{0}.part".format( item['file'] )
+    transfer = {
+      'item': item, 'filePart': filePart, 'fileValidator': "{0}.validator".format( filePart ),
+      'fileRanges': "{0}.ranges".format( filePart ),
+      'validator': None, 'offset': 0, 'isDigest': bool( item.get('md5') ), 'isSegmented': False, 'isChanged': False,
+      'keys': set(), 'segments': [], 'segmentsRunning': 0, 'segmentsQueued': 0, 'isWriteOk': True, 'response': None
+    }
+    transfer['validator'] = DownloadManager._getValidator( transfer['fileValidator'] )
+    isPart = os.path.exists( filePart ) and os.path.getsize( filePart ) > 0 and not transfer['validator'] is None
+    ranges = DownloadManager._getRanges( transfer['fileRanges'] ) if isPart else None
+    if not ranges is None and self._resumeSegments( transfer, ranges ):
+      self.idle.append( api ) # Missing ranges are requested by _dispatch
+      return
+    if os.path.exists( transfer['fileRanges'] ):
+      os.remove( transfer['fileRanges'] )
+    if isPart and ranges is None:
+      transfer['offset'] = os.path.getsize( filePart )
+      segment = { 'start': transfer['offset'], 'end': None } # Resume
+    else:
+      segment = { 'start': 0, 'end': DownloadManager.segmentSize - 1 } # Size and ranges of server
+    self._requestSegment( api, transfer, segment )
+
+  def _addSegments(self, transfer, start, end, total):
+    # Range [ start, end ) by 'total' segments
+    step = int( math.ceil( ( end - start ) / float( total ) ) )
+    for begin in xrange( start, end, step ):
+      segment = { 'start': begin, 'end': min( begin + step, end ) - 1 }
+      transfer['segmentsQueued'] += 1
+      self.queueSegments.append( ( transfer, segment ) )
+    transfer['isSegmented'] = True
+
+  def _startSegments(self, transfer, size, isParallel, ranges):
+    transfer.update( { 'size': size, 'isParallel': isParallel, 'ranges': ranges, 'prefix': 0, 'isDigestFinal': False } )
+    if transfer['isDigest']:
+      self.idKey += 1
+      transfer['keyDigest'] = self.idKey
+      self.writer.put( ( 'prefix', transfer['keyDigest'], transfer['filePart'], 0 ) )
+    DownloadManager._saveRanges( transfer )
+
+  def _resumeSegments(self, transfer, ranges):
+    # Segmented '.part', return False when it does not have missing ranges( download again )
+    ( size, missing, gaps ) = ( ranges['size'], 0, [] )
+    start = 0
+    for r in ranges['ranges']:
+      if r[0] > start:
+        gaps.append( ( start, r[0] ) )
+      start = max( start, r[1] )
+    if start < size:
+      gaps.append( ( start, size ) )
+    missing = sum( g[1] - g[0] for g in gaps )
+    if missing == 0:
+      return False
+    self._startSegments( transfer, size, ranges['isParallel'], ranges['ranges'] )
+    total = DownloadManager.segments - 1 if ranges['isParallel'] else 1
+    for ( start, end ) in gaps:
+      self._addSegments( transfer, start, end, max( 1, int( round( total * ( end - start ) / float( missing ) ) ) ) )
+    return True
+
+  def _setRange(self, transfer, segment):
+    # Range written by segment, the MD5 reads the prefix of file without holes
+    DownloadManager._addRange( transfer['ranges'], segment['start'], segment['start'] + segment['received'] )
+    DownloadManager._saveRanges( transfer )
+    r = transfer['ranges'][0]
+    isOk = transfer['response'] is None or transfer['response']['isOk']
+    isOpen = transfer['segmentsRunning'] > 0 or transfer['segmentsQueued'] > 0
+    if not isOpen or transfer['isDigestFinal']: # Last 'close' reads the rest of file
+      return
+    if isOk and transfer['isDigest'] and r[0] == 0 and r[1] > transfer['prefix']:
+      transfer['prefix'] = r[1]
+      self.writer.put( ( 'prefix', transfer['keyDigest'], transfer['filePart'], r[1] ) )
+
+  def _requestSegment(self, api, transfer, segment):
+    def setHeaders(headers):
+      if headers['statusCode'] != 206 and not isFirst: # Content changed( If-Range )
+        transfer['isChanged'] = True
+        msg = "Content of '{0}' changed while downloading".format( os.path.basename( transfer['item']['file'] ) )
+        self._setResponse( transfer, { 'isOk': False, 'message': msg, 'errorCode': -1 } )
+        return
+      ( mode, size ) = ( 'r+b', None )
+      if isFirst and headers['statusCode'] != 206: # All content
+        transfer['offset'] = 0
+        DownloadManager._saveValidator( transfer, headers )
+        mode = 'wb'
+      elif isFirst and segment['start'] == 0:
+        DownloadManager._saveValidator( transfer, headers )
+        mode = 'wb'
+        m = DownloadManager.reContentRange.match( headers['contentRange'] )
+        if not m is None and int( m.group(1) ) > DownloadManager.segmentSize:
+          size = int( m.group(1) ) # Preallocated
+          isParallel = headers['acceptRanges'] == 'bytes'
+          self._startSegments( transfer, size, isParallel, [] )
+          total = DownloadManager.segments - 1 if isParallel else 1
+          self._addSegments( transfer, DownloadManager.segmentSize, size, total )
+      elif isFirst:
+        mode = 'ab'
+      isDigest = transfer['isDigest'] and not transfer['isSegmented'] # Segmented: MD5 by prefix( _setRange )
+      self.writer.put( ( 'open', key, transfer['filePart'], mode, isDigest, segment['start'], size ) )
+      segment['isOpen'] = True
+      if transfer['isSegmented']:
+        self._dispatch()
+
+    def setSave(data):
+      if segment['isFailed']:
+        return
+      data = data.data()
+      segment['received'] += len( data )
+      self.queuedBytes += len( data )
+      self.writer.put( ( 'write', key, data ) )
+      if not self.isPaused and self.queuedBytes >= DownloadManager.queueBytes:
+        self.isPaused = True
+        self._setPause()
+
+    def setFinished(response):
+      self.idle.append( api )
+      segment['isRunning'] = False
+      transfer['segmentsRunning'] -= 1
+      self.progress.pop( key, None )
+      if response['isOk'] and not segment['isOpen']:
+        self.writer.put( ( 'open', key, transfer['filePart'], 'ab', transfer['isDigest'], 0, None ) ) # Without data
+      self._setResponse( transfer, response )
+      isLast = transfer['segmentsRunning'] == 0 and transfer['segmentsQueued'] == 0
+      isDigest = isLast and transfer['isSegmented'] and transfer['isDigest'] and transfer['response']['isOk']
+      if isDigest:
+        transfer['isDigestFinal'] = True
+      self.writer.put( ( 'close', key, transfer['keyDigest'] if isDigest else None ) ) # See _closed
+      if not self.isKilled:
+        self._dispatch()
+
+    def setProgress(bytesReceived, bytesTotal):
+      offset = transfer['offset'] if isFirst else 0
+      self.progress[ key ] = ( offset + bytesReceived, offset + max( bytesTotal, bytesReceived ) )
+      now = time.time()
+      if now - self.lastProgress < DownloadManager.progressInterval:
+        return
+      self.lastProgress = now
+      received = sum( v[0] for v in self.progress.itervalues() )
+      total = sum( v[1] for v in self.progress.itervalues() )
+      self.setProgress( received / 1024, total / 1024 ) # Kilobytes, limit of int in progress bar
+
+    self.idKey += 1
+    key = self.idKey
+    isFirst = len( transfer['keys'] ) == 0 and not transfer['isSegmented']
+    ( segment['isOpen'], segment['isFailed'], segment['isRunning'], segment['api'] ) = ( False, False, True, api )
+    segment['received'] = 0
+    transfer['keys'].add( key )
+    transfer['segmentsRunning'] += 1
+    self.keys[ key ] = ( transfer, segment )
+    if segment['end'] is None:
+      headers = { 'Range': "bytes={0}-".format( segment['start'] ), 'If-Range': transfer['validator'] }
+    else:
+      headers = { 'Range': "bytes={0}-{1}".format( segment['start'], segment['end'] ) }
+      if not transfer['validator'] is None:
+        headers['If-Range'] = transfer['validator']
+    transfer['segments'].append( segment )
+    api.saveImage( transfer['item']['url'], setFinished, setSave, setProgress, headers, setHeaders )
+
+  def _setResponse(self, transfer, response):
+    # First error of segments, the others segments are canceled
+    if not transfer['response'] is None and not transfer['response']['isOk']:
+      return
+    transfer['response'] = response
+    if response['isOk']:
+      return
+    for segment in transfer['segments']:
+      segment['isFailed'] = True
+      if segment['isRunning']:
+        segment['api'].kill()
+    queued = [ item for item in self.queueSegments if item[0] is transfer ]
+    for item in queued:
+      self.queueSegments.remove( item )
+    transfer['segmentsQueued'] = 0
+
+  def _setPause(self):
+    # Backlog of writer pauses all
+    for api in self.apis:
+      api.access.pause( self.isPaused )
+
+  @QtCore.pyqtSlot(int)
+  def _written(self, totalBytes):
+    self.queuedBytes -= totalBytes
+    if self.isPaused and self.queuedBytes <= DownloadManager.queueBytes / 2:
+      self.isPaused = False
+      self._setPause()
+
+  @QtCore.pyqtSlot(int, bool, str)
+  def _closed(self, key, isOk, digest):
+    ( transfer, segment ) = self.keys.pop( key )
+    transfer['keys'].discard( key )
+    transfer['isWriteOk'] = transfer['isWriteOk'] and isOk
+    if isOk and transfer['isSegmented'] and segment['received'] > 0: # Bytes written before a failure are kept
+      self._setRange( transfer, segment )
+    if len( transfer['keys'] ) > 0 or transfer['segmentsRunning'] > 0 or transfer['segmentsQueued'] > 0:
+      return
+    ( item, response, isOk ) = ( transfer['item'], transfer['response'], transfer['isWriteOk'] )
+    self.running -= 1
+    if response['isOk'] and not isOk:
+      msg = "Error writing '{0}'".format( transfer['filePart'] )
+      response = { 'isOk': False, 'message': msg, 'errorCode': -1 }
+    isChecksum = True
+    if response['isOk'] and item.get('md5') and digest != item['md5']:
+      ( isOk, isChecksum ) = ( False, False )
+      msg = "Checksum MD5 mismatch( {0} != {1} )".format( digest, item['md5'] )
+      response = { 'isOk': False, 'message': msg, 'errorCode': -1 }
+    if response['isOk']:
+      if os.path.exists( item['file'] ):
+        os.remove( item['file'] )
+      os.rename( transfer['filePart'], item['file'] )
+    # Kept for resume, except content changed or 416( range not satisfiable )
+    if response['isOk'] or not isOk or transfer['isChanged'] or response.get('statusCode') == 416:
+      for name in ( transfer['filePart'], transfer['fileValidator'], transfer['fileRanges'] ):
+        if os.path.exists( name ):
+          os.remove( name )
+    if self.isKilled:
+      if self.running == 0:
+        self.finished.emit()
+      return
+    if not isChecksum and item.get('checksumRetries', 0) < DownloadManager.checksumRetries:
+      item['checksumRetries'] = item.get('checksumRetries', 0) + 1
+      self._push( item )
+    else:
+      self._setItem( item, response )
+    self._dispatch()
+
+  def isRunning(self):
+    return not self.isKilled and ( self.running > 0 or len( self.queue ) > 0 )
+
+  def kill(self):
+    self.isKilled = True
+    self.queue = []
+    for ( transfer, segment ) in self.queueSegments:
+      transfer['segmentsQueued'] -= 1
+      isClosed = transfer['segmentsRunning'] == 0 and len( transfer['keys'] ) == 0
+      if transfer['segmentsQueued'] == 0 and isClosed:
+        self.running -= 1
+    self.queueSegments.clear()
+    for api in self.apis:
+      api.kill()
+    self.isPaused = False
+    self._setPause() # Paused replies must be read for finish
+    if self.running == 0:
+      self.finished.emit()
+
+  def finish(self):
+    # Stop the thread of writer
+    if self.thread.isRunning():
+      self.writer.put( ( 'stop', ) )
+      self.thread.quit()
+      self.thread.wait()
+
+
+class PipelineAssets(QtCore.QObject):
+  # Activate, poll status and download assets
+
+  finished = QtCore.pyqtSignal()
+  pollFirst, pollFactor, pollMax = 5.0, 1.5, 60.0 # Seconds
+  pollTimeout = 3600 # Seconds for asset be active
+
+  def __init__(self, schedulerActivate, apisPoll, downloadManager):
+    super( PipelineAssets, self ).__init__()
+    ( self.schedulerActivate, self.apisPoll, self.downloadManager ) = ( schedulerActivate, apisPoll, downloadManager )
+    self.timer = QtCore.QTimer( self )
+    self.timer.setSingleShot( True )
+    self.timer.timeout.connect( self._poll )
+    self.idlePoll, self.polls = list( apisPoll ), [] # polls: heap of ( time, order, scene )
+    self.pollItems = {} # scene( item_type, item_id ): items, one request has the status of all assets
+    self.callbacks = None
+    self.order = self.totalItems = self.totalDone = 0
+    self.isKilled = self.isKilling = False
+    self.schedulerActivate.finished.connect( self._killed )
+    self.downloadManager.finished.connect( self._killed )
+
+  def start(self, items, callbacks):
+    # callbacks: 'setStatus', 'setItem' and 'setProgress', return False while previous run is in flight
+    if self._isActive() or not self.schedulerActivate.start( [], self._activated ):
+      return False
+    self.callbacks = callbacks
+    self.idlePoll, self.polls, self.pollItems = list( self.apisPoll ), [], {}
+    ( self.totalItems, self.totalDone ) = ( len( items ), 0 )
+    self.isKilled = False
+    self.downloadManager.start( [], self._downloaded, callbacks['setProgress'] )
+    if self.totalItems == 0:
+      self.finished.emit()
+      return True
+    now = time.time()
+    for item in items:
+      ( item['poll_wait'], item['poll_deadline'] ) = ( PipelineAssets.pollFirst, now + PipelineAssets.pollTimeout )
+      self._next( item )
+    self._poll() # Assets of same scene grouped
+    return True
+
+  def _next(self, item):
+    status = item['status']
+    if status.has_key('location'):
+      ( item['url'], item['md5'] ) = ( status['location'], status.get('md5') )
+      self.downloadManager.add( [ item ] )
+    elif status.get('status') == 'inactive' and status.has_key('activate'):
+      self.schedulerActivate.add( [ { 'url': status['activate'], 'item': item } ] )
+    elif status.get('status') in ( 'activating', 'active', '*Need calculate*' ):
+      self._schedulePoll( item, status.get('status') == '*Need calculate*' )
+    else:
+      msg = "Asset not available (status = {0})".format( status.get('status') )
+      self._finishItem( item, { 'isOk': False, 'message': msg, 'errorCode': -1 } )
+
+  def _finishItem(self, item, response):
+    self.totalDone += 1
+    self.callbacks['setItem']( item, response )
+    if self.totalDone == self.totalItems:
+      self.finished.emit()
+
+  def _activated(self, itemActivate, response):
+    if self.isKilled:
+      return
+    item = itemActivate['item']
+    isOk = response['isOk'] or response['errorCode'] in range( API_PlanetLabs.errorCodeLimitOK[0], API_PlanetLabs.errorCodeLimitOK[1] + 1 )
+    if not isOk:
+      self._finishItem( item, response )
+      return
+    item['status']['status'] = 'activating'
+    self._schedulePoll( item )
+    self._poll()
+
+  def _schedulePoll(self, item, now=False):
+    t = time.time()
+    if t > item['poll_deadline']:
+      self._finishItem( item, { 'isOk': False, 'message': "Timeout of activation", 'errorCode': -1 } )
+      return
+    if not now:
+      t += item['poll_wait']
+      item['poll_wait'] = min( PipelineAssets.pollMax, item['poll_wait'] * PipelineAssets.pollFactor )
+    scene = ( item['item_type'], item['item_id'] )
+    if scene in self.pollItems: # Other asset of scene is waiting
+      self.pollItems[ scene ].append( item )
+      return
+    self.pollItems[ scene ] = [ item ]
+    self.order += 1
+    heapq.heappush( self.polls, ( t, self.order, scene ) ) # Requested by _poll
+
+  @QtCore.pyqtSlot()
+  def _poll(self):
+    if self.isKilled:
+      return
+    now = time.time()
+    while len( self.idlePoll ) > 0 and len( self.polls ) > 0 and self.polls[0][0] <= now:
+      scene = heapq.heappop( self.polls )[2]
+      self._requestStatus( self.idlePoll.pop(), scene, self.pollItems.pop( scene ) )
+    if len( self.idlePoll ) > 0 and len( self.polls ) > 0:
+      self.timer.start( int( ( self.polls[0][0] - now ) * 1000 ) + 1 )
+
+  def _requestStatus(self, api, scene, items):
+    def setFinished(response):
+      self.idlePoll.append( api )
+      if self.isKilled:
+        self._killed()
+        return
+      if not response['isOk']:
+        for item in items:
+          self._schedulePoll( item ) # Try again
+      else:
+        self.callbacks['setStatus']( items[0], response['assets_status'] )
+        for item in items:
+          item['status'] = response['assets_status'][ "a_{0}".format( item['asset'] ) ]
+          self._next( item )
+      self._poll()
+
+    api.getAssetsStatus( scene[0], scene[1], setFinished )
+
+  def _downloaded(self, item, response):
+    if not self.isKilled:
+      self._finishItem( item, response )
+
+  def _isActive(self):
+    # Requests in flight
+    isPolling = len( self.idlePoll ) < len( self.apisPoll )
+    return isPolling or self.schedulerActivate.running > 0 or self.downloadManager.running > 0
+
+  @QtCore.pyqtSlot()
+  def _killed(self):
+    if not self.isKilling or self._isActive():
+      return
+    self.isKilling = False
+    self.finished.emit()
+
+  def isRunning(self):
+    return self.isKilling or ( not self.isKilled and self.totalDone < self.totalItems )
+
+  def kill(self):
+    self.isKilled = self.isKilling = True
+    self.timer.stop()
+    self.polls, self.pollItems = [], {}
+    self.schedulerActivate.kill()
+    for api in self.apisPoll:
+      api.kill()
+    self.downloadManager.kill()
+    self._killed()
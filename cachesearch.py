@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Cache Search
+Description          : Cache of search of scenes in disk
+Date                 : October, 2026
+copyright            : (C) 2015 by Luiz Motta
+email                : motta.luiz@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os, json, time, hashlib
+
+
+class CacheSearch(object):
+  # Scenes of search by request in JSON lines, expired by 'ttl' and removed by LRU above 'maxSize'
+
+  dirName = 'cache_search'
+  ttl = 3600 # Seconds
+  maxSize = 200 * 1024 * 1024 # Bytes
+  totalBatch = 250 # Scenes by read
+
+  def __init__(self, path):
+    self.path = os.path.join( path, CacheSearch.dirName )
+    if not os.path.exists( self.path ):
+      os.makedirs( self.path )
+    self.fileWrite = self.key = None # Set by begin
+
+  def _getFile(self, key):
+    return os.path.join( self.path, "{0}.jsonl".format( key ) )
+
+  @staticmethod
+  def getKey(json_request):
+    text = json.dumps( json_request, sort_keys=True, separators=( ',', ':' ) )
+    return hashlib.sha1( text ).hexdigest()
+
+  def has(self, key):
+    fileCache = self._getFile( key )
+    if not os.path.exists( fileCache ):
+      return False
+    with open( fileCache ) as f:
+      try:
+        header = json.loads( f.readline() )
+      except ValueError:
+        header = { 'created': 0 }
+    if time.time() - header['created'] > CacheSearch.ttl:
+      os.remove( fileCache )
+      return False
+    return True
+
+  def read(self, key):
+    # Iterator of list of scenes
+    fileCache = self._getFile( key )
+    os.utime( fileCache, None ) # Recently used
+    scenes = []
+    with open( fileCache ) as f:
+      f.readline() # Header
+      for line in f:
+        scenes.append( json.loads( line ) )
+        if len( scenes ) == CacheSearch.totalBatch:
+          yield scenes
+          scenes = []
+    if len( scenes ) > 0:
+      yield scenes
+
+  def begin(self, key, json_request):
+    self.key = key
+    self.fileWrite = open( "{0}.part".format( self._getFile( key ) ), 'w' )
+    header = { 'created': time.time(), 'request': json_request }
+    self.fileWrite.write( json.dumps( header ) + '\n' )
+
+  def add(self, scenes):
+    lines = [ json.dumps( item ) + '\n' for item in scenes ]
+    self.fileWrite.writelines( lines )
+
+  def commit(self):
+    self.fileWrite.close()
+    fileCache = self._getFile( self.key )
+    if os.path.exists( fileCache ):
+      os.remove( fileCache )
+    os.rename( self.fileWrite.name, fileCache )
+    self.fileWrite = self.key = None
+    self.evict()
+
+  def rollback(self):
+    self.fileWrite.close()
+    os.remove( self.fileWrite.name )
+    self.fileWrite = self.key = None
+
+  def evict(self):
+    files = []
+    for name in os.listdir( self.path ):
+      if not name.endswith('.jsonl'):
+        continue
+      fileCache = os.path.join( self.path, name )
+      files.append( ( os.path.getmtime( fileCache ), os.path.getsize( fileCache ), fileCache ) )
+    total = sum( item[1] for item in files )
+    for ( mtime, size, fileCache ) in sorted( files ):
+      if total <= CacheSearch.maxSize:
+        break
+      os.remove( fileCache )
+      total -= size
+
+
+class MarkSearch(object):
+  # Last 'acquired' by AOI and item types, see incremental search
+
+  fileName = 'marks_search.json'
+
+  def __init__(self, path):
+    self.fileMarks = os.path.join( path, MarkSearch.fileName )
+    self.marks = {}
+    if os.path.exists( self.fileMarks ):
+      with open( self.fileMarks ) as f:
+        self.marks = json.load( f )
+
+  @staticmethod
+  def getKey(item_types, geometry):
+    aoi = { 'item_types': sorted( item_types ), 'geometry': geometry }
+    text = json.dumps( aoi, sort_keys=True, separators=( ',', ':' ) )
+    return hashlib.sha1( text ).hexdigest()
+
+  def get(self, key):
+    return self.marks.get( key )
+
+  def set(self, key, acquired):
+    current = self.marks.get( key )
+    if acquired is None or ( not current is None and acquired <= current ):
+      return
+    self.marks[ key ] = acquired
+    filePart = "{0}.part".format( self.fileMarks )
+    with open( filePart, 'w' ) as f:
+      json.dump( self.marks, f )
+    if os.path.exists( self.fileMarks ):
+      os.remove( self.fileMarks )
+    os.rename( filePart, self.fileMarks )
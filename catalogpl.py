@@ -19,12 +19,17 @@ email                : motta.luiz@gmail.com
  ***************************************************************************/
 """
 
-import os, json
+import os, json, datetime
 
 from PyQt4 import QtCore, QtGui
 from qgis import core as QgsCore, gui as QgsGui, utils as QgsUtils
 
-from apiqtpl import API_PlanetLabs
+from apiqtpl import API_PlanetLabs, PagerScenes, ShardsScenes, SchedulerActivate, DownloadManager, PipelineAssets
+from cachesearch import CacheSearch, MarkSearch
+from catalogstore import CatalogStoreGPKG
+from geometrywkb import GeometryWKB
+from indexassets import IndexAssets
+from journaldownloads import JournalDownloads
 from legendlayerpl import ( DialogImageSettingPL, LegendCatalogLayer )
 from legendlayer import LegendRasterGeom
 from managerloginkey import ManagerLoginKey
@@ -38,6 +43,31 @@ class CatalogPL(QtCore.QObject):
   styleFile = 'pl_scenes.qml'
   expressionFile = 'pl_expressions.py'
   expressionDir = 'expressions'
+  prefetchPages = 2 # Pages of search requested while ingesting( 0 = serial )
+  shardWorkers = 4 # Shards of search running concurrently
+  shardTileSize = 2.0 # Degrees of side of tiles of extent
+  shardDays = 90 # Days of slices of dates
+  assetsWorkers = 8 # Requests of status of assets in flight
+  downloadWorkers = 4 # Concurrent transfers of images
+  pollWorkers = 2 # Requests of status of pending assets in flight( activate and download )
+  attributesBatch = 500 # Features changed by write in provider( status of assets and thumbnails )
+  assetsMaxAge = 24 * 3600 # Seconds, refresh of status of assets skips the newer calculations
+  bulkBatch = 0 # Features added between updates of extent, index and repaint( 0 = only at end )
+  fieldsMetadata = [ # Columns from 'meta_json' after 'meta_jsize': ( name, type of field, keys )
+    ( 'item_type', 'string(50)', [ 'item_type' ] ),
+    ( 'cloud_cover', 'double', [ 'cloud_cover' ] ),
+    ( 'sun_elevation', 'double', [ 'sun_elevation' ] ),
+    ( 'gsd', 'double', [ 'gsd' ] ),
+    ( 'analytic_status', 'string(20)', [ 'assets_status', 'a_analytic', 'status' ] ),
+    ( 'analytic_activate', 'string(500)', [ 'assets_status', 'a_analytic', 'activate' ] ),
+    ( 'analytic_location', 'string(500)', [ 'assets_status', 'a_analytic', 'location' ] ),
+    ( 'analytic_md5', 'string(32)', [ 'assets_status', 'a_analytic', 'md5' ] ),
+    ( 'udm_status', 'string(20)', [ 'assets_status', 'a_udm', 'status' ] ),
+    ( 'udm_activate', 'string(500)', [ 'assets_status', 'a_udm', 'activate' ] ),
+    ( 'udm_location', 'string(500)', [ 'assets_status', 'a_udm', 'location' ] ),
+    ( 'udm_md5', 'string(32)', [ 'assets_status', 'a_udm', 'md5' ] )
+  ]
+  indexesMetadata = [ 'item_type', 'cloud_cover', 'analytic_status' ] # Only for catalog in disk
 
   enableRun = QtCore.pyqtSignal( bool )
   
@@ -49,9 +79,12 @@ class CatalogPL(QtCore.QObject):
          'clipboard_key': self.clipboardKey,
          'setting_images': self.settingImages,
          'calculate_status_assets': self.calculateAssetStatus,
+         'refresh_status_assets': self.refreshAssetStatus,
          'activate_assets': self.activateAssets,
          'create_tms': self.CreateTMS_GDAL_WMS,
          'download_images': self.downloadImages,
+         'activate_download_images': self.activateDownloadImages,
+         'clear_journal': self.clearJournal,
          'download_thumbnails': self.downloadThumbnails
       }
       arg = ( CatalogPL.pluginName, slots, self.getTotalAssets )
@@ -63,6 +96,10 @@ class CatalogPL(QtCore.QObject):
       # Next step add all informations (DialogImageSettingPL.getSettings)
       self.settings['current_asset'] = 'planet'
       self.settings['udm'] = False
+      self.settings['force_refresh'] = False
+      self.settings['incremental'] = False
+      self.settings['store_disk'] = False
+      self.settings['download_order'] = 'acquired'
       date2 = QtCore.QDate.currentDate()
       date1 = date2.addMonths( -1 )
       self.settings['date1'] = date1 
@@ -76,6 +113,14 @@ class CatalogPL(QtCore.QObject):
     self.mainWindow = QgsUtils.iface.mainWindow()
 
     self.apiPL = API_PlanetLabs()
+    networkAccess = self.apiPL.access.networkAccess
+    self.poolAPI = [ API_PlanetLabs( networkAccess ) for i in xrange( CatalogPL.assetsWorkers ) ]
+    self.schedulerActivate = SchedulerActivate( self.poolAPI )
+    self.apisShard = [ API_PlanetLabs( networkAccess ) for i in xrange( CatalogPL.shardWorkers ) ] # Reused by searches
+    apisPoll = [ API_PlanetLabs( networkAccess ) for i in xrange( CatalogPL.pollWorkers ) ]
+    apisDownload = [ API_PlanetLabs( networkAccess ) for i in xrange( CatalogPL.downloadWorkers ) ]
+    self.downloadManager = DownloadManager( apisDownload )
+    self.pipeline = PipelineAssets( self.schedulerActivate, apisPoll, self.downloadManager )
     self.mngLogin = ManagerLoginKey('catalogpl_plugin')
     self.legendRasterGeom = LegendRasterGeom( CatalogPL.pluginName )
     self.thread = self.worker = None # initThread
@@ -84,11 +129,11 @@ class CatalogPL(QtCore.QObject):
     self.hasRegisterKey = False
 
     self.layer = self.layerTree = None
+    self.indexAssets = IndexAssets() # Totals of assets for legend
     self.hasCriticalMessage = None
-    self.url_scenes = self.scenes = self.total_features_scenes = None 
+    self.url_scenes = self.total_features_scenes = None 
     self.pixmap = self.messagePL = self.isOkPL = None
     self.legendCatalogLayer = self.settings = None
-    self.imageDownload = self.totalReady = None
     self.currentItem = None
     self.catalog = { 'ltg': None, 'satellite': None, 'typeImage': None }
 
@@ -100,6 +145,7 @@ class CatalogPL(QtCore.QObject):
   def __del__(self):
     self._connect( False )
     self._finishThread()
+    self.downloadManager.finish()
     del self.legendRasterGeom
 
   def _initThread(self):
@@ -205,20 +251,117 @@ class CatalogPL(QtCore.QObject):
       r = { 'isOk': True, 'status': status }
       if assets_status[asset].has_key('activate'):
         r['activate'] = assets_status[asset]['activate']
-      if assets_status[asset].has_key('location'):
-        r['location'] = assets_status[asset]['location']
+      for key in ( 'location', 'md5' ):
+        if assets_status[asset].has_key( key ):
+          r[ key ] = assets_status[asset][ key ]
       return r
 
     return { 'analytic': getValues('a_analytic'), 'udm': getValues('a_udm') }
 
-  def _calculateTotalAsset(self, name_asset, valuesAssets, totalAssets):
-    asset = valuesAssets[ name_asset ]
-    if not asset['isOk']:
+  def _getValuesAssetsFeature(self, feat):
+    # From columns of assets( see CatalogPL.fieldsMetadata ), catalogs without them use 'meta_json'
+    if feat.fieldNameIndex('analytic_status') == -1:
+      return self._getValuesAssets( json.loads( feat['meta_json'] )['assets_status'] )
+    assets_status = {}
+    for asset in ( 'analytic', 'udm' ):
+      r = { 'status': feat[ "{0}_status".format( asset ) ] }
+      for key in ( 'activate', 'location', 'md5' ):
+        name = "{0}_{1}".format( asset, key )
+        if feat.fieldNameIndex( name ) == -1: # Catalog before the column
+          continue
+        value = feat[ name ]
+        if value: # Not NULL
+          r[ key ] = value
+      assets_status[ "a_{0}".format( asset ) ] = r
+    return self._getValuesAssets( assets_status )
+
+  def _getIdsFields(self, names):
+    # Index of columns in catalog( GeoPackage has 'fid' as first column )
+    return dict( ( name, self.layer.fieldNameIndex( name ) ) for name in names )
+
+  def _getIdsMetadata(self):
+    # Index of columns from 'meta_json' in catalog
+    idsMetadata = []
+    for ( name, typeField, keys ) in CatalogPL.fieldsMetadata:
+      idx = self.layer.fieldNameIndex( name )
+      if idx != -1:
+        idsMetadata.append( ( idx, keys ) )
+    return idsMetadata
+
+  @staticmethod
+  def _getValuesMetadata(meta_json, idsMetadata):
+    values = {}
+    for ( idx, keys ) in idsMetadata:
+      value = meta_json
+      for key in keys:
+        value = value.get( key ) if isinstance( value, dict ) else None
+      values[ idx ] = value
+    return values
+
+  def _changeAttributes(self, changes, isLast=False):
+    # Batch { fid: { idx: value } } to provider, without edit buffer and undo
+    if len( changes ) == 0 or ( not isLast and len( changes ) < CatalogPL.attributesBatch ):
+      return True
+    isOk = self.layer.dataProvider().changeAttributeValues( changes )
+    changes.clear()
+    if isLast:
+      self.layer.triggerRepaint()
+    return isOk
+
+  def _addImageCatalog(self, file_image, geom, v_crs, acquired, id_table, id_image):
+    ltgRoot = QgsCore.QgsProject.instance().layerTreeRoot()
+    files_in_map = map( lambda item: item.layer().source(), ltgRoot.findLayers() )
+    if file_image in files_in_map:
       return
-    if asset['status'] == 'inactive' and asset.has_key('activate'):
-      totalAssets[ name_asset ]['activate'] += 1
-    if asset.has_key('location'):
-      totalAssets[ name_asset ]['images'] += 1
+    layer = QgsCore.QgsRasterLayer( file_image, os.path.split( file_image )[-1] )
+    geomTransf = QgsCore.QgsGeometry( geom )
+    ct = QgsCore.QgsCoordinateTransform( v_crs, layer.crs() )
+    geomTransf.transform( ct )
+    wkt_geom = geomTransf.exportToWkt()
+    layer.setCustomProperty( 'wkt_geom', wkt_geom )
+    layer.setCustomProperty( 'date', acquired )
+    layer.setCustomProperty( 'id_table', id_table )
+    layer.setCustomProperty( 'id_image', id_image )
+    QgsCore.QgsMapLayerRegistry.instance().addMapLayer( layer, addToLegend=False )
+    self.catalog['ltg'].addLayer( layer )
+    self.legendRasterGeom.setLayer( layer )
+
+  def _getValuesOrder(self, feat):
+    # Values for order of downloads, see _setPriorities
+    values = {}
+    for name in ( 'cloud_cover', 'rank' ):
+      value = feat[ name ] if feat.fieldNameIndex( name ) != -1 else None
+      values[ name ] = value if isinstance( value, ( int, long, float ) ) else None # NULL
+    return values
+
+  def _setPriorities(self, items):
+    # 'priority' of items for DownloadManager by order of settings( see DialogImageSettingPL.downloadOrders )
+    def getOverlap(item):
+      geom = item['geom'].intersection( extent )
+      return None if geom is None else -1 * geom.area()
+
+    def getLast(value):
+      return ( 1, None ) if value is None else ( 0, value )
+
+    order = self.settings['download_order']
+    if order == 'acquired':
+      items.sort( key=lambda item: item['acquired'], reverse=True )
+    elif order in ( 'cloud_cover', 'rank' ):
+      items.sort( key=lambda item: getLast( item.get( order ) ) )
+    elif order == 'overlap':
+      crsCanvas = self.canvas.mapSettings().destinationCrs()
+      ct = QgsCore.QgsCoordinateTransform( crsCanvas, self.layer.crs() )
+      extent = QgsCore.QgsGeometry.fromRect( ct.transform( self.canvas.extent() ) )
+      items.sort( key=lambda item: getLast( getOverlap( item ) ) )
+    for i in xrange( len( items ) ):
+      items[ i ]['priority'] = ( i, )
+
+  @staticmethod
+  def _getItemType(feat):
+    # From column 'item_type', catalogs without it use 'meta_json'
+    if feat.fieldNameIndex('item_type') != -1 and feat['item_type']:
+      return ( True, feat['item_type'] )
+    return API_PlanetLabs.getValue( feat['meta_json'], [ 'item_type' ] )
 
   def _hasLimiteErrorOK(self, response):
     err = response['errorCode']
@@ -346,21 +489,32 @@ class CatalogPL(QtCore.QObject):
     def createLayer():
       atts = [
         "id:string(25)", "acquired:string(35)", "thumbnail:string(2000)",
-        "meta_html:string(2000)", "meta_json:string(2000)",
-        "meta_jsize:integer"
+        "meta_json:string(2000)", "meta_jsize:integer"
       ]
+      atts += map( lambda item: "{0}:{1}".format( item[0], item[1] ), CatalogPL.fieldsMetadata )
       l_fields = map( lambda item: "field=%s" % item, atts  )
-      l_fields.insert( 0, "Multipolygon?crs=epsg:4326" )
-      l_fields.append( "index=yes" )
+      l_fields.insert( 0, "Multipolygon?crs=epsg:4326" ) # Spatial index created after bulk of features
       uri = '&'.join( l_fields )
       
       date1 = self.settings['date1'].toString( QtCore.Qt.ISODate )
       date2 = self.settings['date2'].toString( QtCore.Qt.ISODate )
       arg = ( self.settings['current_asset'].title(), date1, date2 )
       name = "PL {}({} to {})".format( *arg )
-      vl = QgsCore.QgsVectorLayer( uri, name, "memory" )
+      vl = None
+      if self.settings['store_disk'] and self.settings['isOk']:
+        r = CatalogStoreGPKG( self.settings['path'] ).create( name, atts, CatalogPL.indexesMetadata )
+        if r['isOk']:
+          vl = QgsCore.QgsVectorLayer( r['uri'], name, "ogr" )
+        else:
+          self.msgBar.pushMessage( CatalogPL.pluginName, r['message'], QgsGui.QgsMessageBar.WARNING, 4 )
+      if vl is None or not vl.isValid():
+        vl = QgsCore.QgsVectorLayer( uri, name, "memory" )
+      field = QgsCore.QgsField( 'meta_html', QtCore.QVariant.String )
+      vl.addExpressionField( 'getHtmlMetadata()', field ) # Virtual, rendered from 'meta_json' for each feature
+      vl.setCustomProperty( 'date1', date1 )
       # Add layer
       self.layer = QgsCore.QgsMapLayerRegistry.instance().addMapLayer( vl, addToLegend=False )
+      self.layer.selectionChanged.connect( self._selectionChanged )
       self.layerTree = QgsCore.QgsProject.instance().layerTreeRoot().insertLayer( 0, self.layer )
       # Symbology
       ns = os.path.join( os.path.dirname( __file__ ), CatalogPL.styleFile )
@@ -368,6 +522,40 @@ class CatalogPL(QtCore.QObject):
       QgsUtils.iface.legendInterface().refreshLayerSymbology( self.layer )
       self.layerTree.setVisible( QtCore.Qt.Unchecked )
 
+    def extentFilter():
+      crsCanvas = self.canvas.mapSettings().destinationCrs()
+      crsLayer = QgsCore.QgsCoordinateReferenceSystem( 4326, QgsCore.QgsCoordinateReferenceSystem.EpsgCrsId ) # See createLayer
+      ct = QgsCore.QgsCoordinateTransform( crsCanvas, crsLayer )
+      extent = self.canvas.extent() if crsCanvas == crsLayer else ct.transform( self.canvas.extent() )
+      return json.loads( QgsCore.QgsGeometry.fromRect( extent ).exportToGeoJSON() )
+
+    def get_item_types():
+      # Same list of DialogImageSettingPL.nameAssets
+      item_types = {
+        'planet':   'PSScene4Band',
+        'rapideye': 'REScene',
+        'landsat8': 'Landsat8L1G',
+        'sentinel2': 'Sentinel2L1C'
+      }
+      return [ item_types[ self.settings['current_asset'] ] ]
+
+    def getMarkAcquired():
+      # Incremental search: only for the catalog with same AOI and item types
+      if not self.settings['incremental'] or not self.settings['isOk'] or self.layerTree is None:
+        return None
+      if self.layer.customProperty('key_aoi') != keyAOI:
+        return None
+      return MarkSearch( self.settings['path'] ).get( keyAOI )
+
+    def dialogReplaceCatalog():
+      # Incremental checked, but the AOI(extent of map), item types or mark of search changed
+      title = "Planet Labs"
+      msg = "The incremental search needs the same extent of map and type of image of the current catalog.\n" \
+            "Replace the current catalog with a full search?"
+      msgBox = QtGui.QMessageBox( QtGui.QMessageBox.Question, title, msg, QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,  self.mainWindow )
+      msgBox.setDefaultButton( QtGui.QMessageBox.No )
+      return msgBox.exec_()
+
     def removeFeatures():
       prov = self.layer.dataProvider()
       if prov.featureCount() > 0:
@@ -381,8 +569,9 @@ class CatalogPL(QtCore.QObject):
         def setFinishedPL(response):
           self.isOkPL = response['isOk']
           if self.isOkPL:
-            self.total_features_scenes = response['total']
-            self.url_scenes = response['url_scenes']
+            self.total_features_scenes = len( response['scenes'] )
+            self.url_scenes = response['url']
+            firstPage.update( response ) # Ingested as first page
           else:
             self.messagePL = response[ 'message' ]
 
@@ -398,86 +587,113 @@ class CatalogPL(QtCore.QObject):
           self.messagePL = None
           self.total_features_scenes = None
 
-      def addFeatures( ):
-        def setFinishedPL(response):
-          self.isOkPL = response['isOk']
-          if self.isOkPL:
-            ( self.url_scenes, self.scenes ) = ( response['url'], response['scenes'] )
-          else:
-            self.messagePL = response['message']
-
-          loop.quit()
-
-        def setScenesResponse():
-          def getFeatures():
-            fields = [ 'id', 'acquired', 'thumbnail', 'meta_html', 'meta_json', 'meta_jsize' ] # See FIELDs order from createLayer
-            features = []
-            for item in self.scenes:
-              # Fields
-              meta_json = item['properties']
-              vFields =  { }
-              vFields[ fields[0] ] = item['id']
-              vFields[ fields[1] ] = meta_json['acquired']
-              del meta_json['acquired']
-              vFields[ fields[2] ] = "Need download thumbnail"
-              meta_json['assets_status'] = {
-                'a_analytic': { 'status': '*Need calculate*' },
-                'a_udm': { 'status': '*Need calculate*' }
-              }
-              vFields[ fields[3] ] = API_PlanetLabs.getHtmlTreeMetadata( meta_json, '')
-              vjson = json.dumps( meta_json )
-              vFields[ fields[4] ] = vjson
-              vFields[ fields[5] ] = len( vjson)
-              # Geom
-              geomItem = item['geometry']
-              geomCoords = geomItem['coordinates']
-              if geomItem['type'] == 'Polygon':
-                qpolygon = map ( lambda polyline: map( lambda item: QgsCore.QgsPoint( item[0], item[1] ), polyline ), geomCoords )
-                geom = QgsCore.QgsGeometry.fromMultiPolygon( [ qpolygon ] )
-              elif geomItem['type'] == 'MultiPolygon':
-                qmultipolygon = []
-                for polygon in geomCoords:
-                    qpolygon = map ( lambda polyline: map( lambda item: QgsCore.QgsPoint( item[0], item[1] ), polyline ), polygon )
-                    qmultipolygon.append( qpolygon )
-                geom = QgsCore.QgsGeometry.fromMultiPolygon( qmultipolygon )
-              else:
-                continue
-              feat = QgsCore.QgsFeature()
-              feat.setGeometry( geom )
-
-              atts = map( lambda item: vFields[ item ], fields )
-              feat.setAttributes( atts )
-              features.append( feat )
-
-            return features
-
-          def commitFeatures():
-            if not self.layerTree is None and len( features ) > 0:
-              self.layer.startEditing()
-              prov.addFeatures( features )
-              self.layer.commitChanges()
-              self.layer.updateExtents()
-
-          if self.isOkPL: 
-            if len( self.scenes ) == 0:
-              return
-            features = getFeatures()
-            del self.scenes[:]
-            self.total_features_scenes += len( features ) 
-            commitFeatures()
-            del features[:]
-          else:
-            self.hasCriticalMessage = True
-            self.msgBar.popWidget()
-            self.msgBar.pushMessage( CatalogPL.pluginName, self.messagePL, QgsGui.QgsMessageBar.CRITICAL, 4 )
-            self.messagePL = None
-            self.url_scenes = None
-            self.scenes = []
+      def addFeatures(response):
+        def getFeatures():
+          features = []
+          for item in scenes:
+            # Fields
+            meta_json = item['properties']
+            vFields =  { }
+            vFields['id'] = item['id']
+            vFields['acquired'] = meta_json['acquired']
+            del meta_json['acquired']
+            vFields['thumbnail'] = "Need download thumbnail"
+            meta_json['assets_status'] = {
+              'a_analytic': { 'status': '*Need calculate*' },
+              'a_udm': { 'status': '*Need calculate*' }
+            }
+            vjson = json.dumps( meta_json )
+            vFields['meta_json'] = vjson
+            vFields['meta_jsize'] = len( vjson)
+            # Geom
+            geom = GeometryWKB.getGeometry( item['geometry'] ) # WKB from coordinates
+            if geom is None:
+              continue
+            feat = QgsCore.QgsFeature()
+            feat.setGeometry( geom )
+
+            atts = [ None ] * totalFields
+            for name, value in vFields.iteritems():
+              atts[ idsFields[ name ] ] = value
+            for idx, value in CatalogPL._getValuesMetadata( meta_json, idsMetadata ).iteritems():
+              atts[ idx ] = value
+            feat.setAttributes( atts )
+            features.append( feat )
+
+          return features
+
+        def upsertFeatures():
+          # Scenes in catalog are updated( keep thumbnail and status of assets ), return the new scenes
+          news, changeAtts, changeGeoms = [], {}, {}
+          for feat in features:
+            atts = feat.attributes()
+            fid = idsCatalog.get( atts[ idsFields['id'] ] )
+            if fid is None:
+              news.append( feat )
+              continue
+            request = QgsCore.QgsFeatureRequest( fid ).setFlags( QgsCore.QgsFeatureRequest.NoGeometry )
+            featCatalog = self.layer.getFeatures( request ).next()
+            meta_json = json.loads( atts[ idsFields['meta_json'] ] )
+            meta_json['assets_status'] = json.loads( featCatalog['meta_json'] )['assets_status']
+            vjson = json.dumps( meta_json )
+            changeAtts[ fid ] = CatalogPL._getValuesMetadata( meta_json, idsMetadata )
+            changeAtts[ fid ].update( {
+              idsFields['acquired']: atts[ idsFields['acquired'] ],
+              idsFields['meta_json']: vjson,
+              idsFields['meta_jsize']: len( vjson )
+            } )
+            changeGeoms[ fid ] = feat.geometry()
+          if len( changeAtts ) > 0:
+            prov.changeAttributeValues( changeAtts )
+            prov.changeGeometryValues( changeGeoms )
+          return news
+
+        def commitFeatures():
+          if not self.layerTree is None and len( features ) > 0:
+            ( ok, feats ) = prov.addFeatures( features ) # Bulk, without edit buffer
+            if not idsCatalog is None:
+              for feat in feats:
+                idsCatalog[ feat.attributes()[ idsFields['id'] ] ] = feat.id()
+            dataSearch['pending'] += len( feats )
+            if CatalogPL.bulkBatch > 0 and dataSearch['pending'] >= CatalogPL.bulkBatch:
+              updateLayer()
+
+        if response['isOk']:
+          scenes = response['scenes']
+          if len( scenes ) == 0:
+            return
+          acquired = max( item['properties']['acquired'] for item in scenes )
+          if dataSearch['acquired'] is None or acquired > dataSearch['acquired']:
+            dataSearch['acquired'] = acquired
+          features = getFeatures()
+          del scenes[:]
+          if not idsCatalog is None:
+            features = upsertFeatures()
+          self.total_features_scenes += len( features ) 
+          commitFeatures()
+          del features[:]
+        else:
+          self.hasCriticalMessage = True
+          self.msgBar.popWidget()
+          self.msgBar.pushMessage( CatalogPL.pluginName, response['message'], QgsGui.QgsMessageBar.CRITICAL, 4 )
+          pager.finish()
 
-        loop = QtCore.QEventLoop()
-        self.apiPL.getScenes( self.url_scenes,  setFinishedPL )
-        loop.exec_()
-        setScenesResponse()
+      def populateFromCache():
+        self.canvas.scene().removeItem( rb )
+        self.msgBar.popWidget()
+        item_types = ",".join( json_request['item_types'] )
+        msg = "Item types: {0} (cache)".format( item_types )
+        self.mbcancel = MessageBarCancel( CatalogPL.pluginName, self.msgBar, msg, self.apiPL.kill )
+        self.total_features_scenes = 0
+        for scenes in cache.read( keyCache ):
+          QtCore.QCoreApplication.processEvents() # Cancel by user
+          if self.mbcancel.isCancel or self.layerTree is None :
+            break
+          addFeatures( { 'isOk': True, 'scenes': scenes } )
+          msg = "Adding {0} features...".format( self.total_features_scenes )
+          self.mbcancel.message( msg )
+
+        finished()
 
       def createRubberBand():
 
@@ -495,22 +711,11 @@ class CatalogPL(QtCore.QObject):
         rb.setToCanvasRectangle( canvasRect() )
         return rb
 
-      def extentFilter():
-        crsCanvas = self.canvas.mapSettings().destinationCrs()
-        crsLayer = self.layer.crs()
-        ct = QgsCore.QgsCoordinateTransform( crsCanvas, crsLayer )
-        extent = self.canvas.extent() if crsCanvas == crsLayer else ct.transform( self.canvas.extent() )
-        return json.loads( QgsCore.QgsGeometry.fromRect( extent ).exportToGeoJSON() )
-
-      def get_item_types():
-        # Same list of DialogImageSettingPL.nameAssets
-        item_types = {
-          'planet':   'PSScene4Band',
-          'rapideye': 'REScene',
-          'landsat8': 'Landsat8L1G',
-          'sentinel2': 'Sentinel2L1C'
-        }
-        return [ item_types[ self.settings['current_asset'] ] ]
+      def updateLayer():
+        dataSearch['pending'] = 0
+        self.layer.updateExtents()
+        prov.createSpatialIndex()
+        self.layer.triggerRepaint()
 
       def finished():
         self.canvas.scene().removeItem( rb )
@@ -519,15 +724,22 @@ class CatalogPL(QtCore.QObject):
           
         if self.layerTree is None:
           return
+        updateLayer()
         self.layerTree.setCustomProperty ('showFeatureCount', True )
         
         msg = "Finished the search of images. Found %d images" % self.total_features_scenes
         typeMessage = QgsGui.QgsMessageBar.INFO
         if self.mbcancel.isCancel:
           self.msgBar.popWidget()
-          removeFeatures()
           typeMessage = QgsGui.QgsMessageBar.WARNING
-          msg = "Canceled the search of images. Removed %d features" % self.total_features_scenes
+          if markAcquired is None:
+            removeFeatures()
+            msg = "Canceled the search of images. Removed %d features" % self.total_features_scenes
+          else: # Incremental, the mark is not updated
+            msg = "Canceled the search of images. Added %d features" % self.total_features_scenes
+        elif not self.hasCriticalMessage:
+          MarkSearch( self.settings['path'] ).set( keyAOI, dataSearch['acquired'] )
+          self.layer.setCustomProperty( 'key_aoi', keyAOI )
         self.msgBar.pushMessage( CatalogPL.pluginName, msg, typeMessage, 4 )
 
       date1 = self.settings['date1']
@@ -537,15 +749,28 @@ class CatalogPL(QtCore.QObject):
       sdate1 = "{0}T00:00:00.000000Z".format( date1 )
       sdate2 = "{0}T00:00:00.000000Z".format( date2 )
 
+      idsCatalog = None # Incremental: 'id' -> feature id of catalog
+      if not markAcquired is None:
+        sdate1 = markAcquired
+        request = QgsCore.QgsFeatureRequest().setFlags( QgsCore.QgsFeatureRequest.NoGeometry )
+        request.setSubsetOfAttributes( [ 'id' ], self.layer.pendingFields() )
+        idsCatalog = dict( ( feat['id'], feat.id() ) for feat in self.layer.getFeatures( request ) )
+        arg = ( self.settings['current_asset'].title(), self.layer.customProperty( 'date1', date1 ), date2 )
+        self.layer.setName( "PL {}({} to {})".format( *arg ) )
+      dataSearch = { 'acquired': markAcquired, 'pending': 0 } # High-water mark and features without update of layer
+
       self.msgBar.clearWidgets()
-      msg = "Starting the search of images - %s(%d days)..." % ( date2, days ) 
+      if markAcquired is None:
+        msg = "Starting the search of images - %s(%d days)..." % ( date2, days ) 
+      else:
+        msg = "Starting the search of new images - %s to %s..." % ( markAcquired, date2 )
       self.msgBar.pushMessage( CatalogPL.pluginName, msg, QgsGui.QgsMessageBar.INFO )
       rb = createRubberBand() # Show Rectangle of Query (coordinate in pixel)
       # JSon request
       geometry_filter = {
         'type': 'GeometryFilter',
         'field_name': 'geometry',
-        'config': extentFilter()
+        'config': geometry_config
       }
       date_range_filter = {
         'type': 'DateRangeFilter',
@@ -559,33 +784,62 @@ class CatalogPL(QtCore.QObject):
       #config = [ geometry_filter, date_range_filter, permission_filter ] 
       config = [ geometry_filter, date_range_filter ]
       json_request = {
-        "item_types": get_item_types(),
+        "item_types": item_types,
         "filter": { "type": "AndFilter", "config": config }
       }
-      processScenes( json_request )
-      if self.hasCriticalMessage:
-        self.canvas.scene().removeItem( rb )
-        return
-      if self.total_features_scenes == 0:
-        self.canvas.scene().removeItem( rb )
-        msg = "Not found images"
-        self.msgBar.popWidget()
-        self.msgBar.pushMessage( CatalogPL.pluginName, msg, QgsGui.QgsMessageBar.WARNING, 2 )
+      prov = self.layer.dataProvider()
+      totalFields = len( prov.fields() ) # Without 'meta_html'( virtual )
+      idsFields = self._getIdsFields( [ 'id', 'acquired', 'thumbnail', 'meta_json', 'meta_jsize' ] ) # See createLayer
+      idsMetadata = self._getIdsMetadata()
+      cache = CacheSearch( self.settings['path'] )
+      keyCache = CacheSearch.getKey( json_request )
+      if not self.settings['force_refresh'] and cache.has( keyCache ):
+        populateFromCache()
         return
 
+      requestsShard = ShardsScenes.getRequests( json_request, CatalogPL.shardTileSize, CatalogPL.shardDays )
+      if len( requestsShard ) == 1:
+        firstPage = {}
+        processScenes( json_request )
+        if self.hasCriticalMessage:
+          self.canvas.scene().removeItem( rb )
+          return
+        if self.total_features_scenes == 0:
+          self.canvas.scene().removeItem( rb )
+          msg = "Not found images" if markAcquired is None else "Not found new images"
+          self.msgBar.popWidget()
+          self.msgBar.pushMessage( CatalogPL.pluginName, msg, QgsGui.QgsMessageBar.WARNING, 2 )
+          return
+        pager = PagerScenes( self.apiPL, CatalogPL.prefetchPages ) # Fetch next page while ingest the current page
+        pager.start( self.url_scenes, firstPage )
+      else:
+        pager = ShardsScenes( self.apisShard, CatalogPL.prefetchPages ) # Scenes without repeated 'id'
+        pager.start( requestsShard )
+
       self.msgBar.popWidget()
-      item_types = ",".join( json_request['item_types'] )
-      msg = "Item types: {2}".format( date2, days, item_types )
-      self.mbcancel = MessageBarCancel( CatalogPL.pluginName, self.msgBar, msg, self.apiPL.kill )
+      msg = "Item types: {0}".format( ",".join( item_types ) )
+      if len( requestsShard ) > 1:
+        msg = "{0} - {1} shards".format( msg, len( requestsShard ) )
+      self.mbcancel = MessageBarCancel( CatalogPL.pluginName, self.msgBar, msg, pager.kill )
       self.total_features_scenes = 0
 
-      prov = self.layer.dataProvider()
-      while self.url_scenes:
+      cache.begin( keyCache, json_request )
+      while True:
         if self.mbcancel.isCancel or self.layerTree is None :
           break
-        addFeatures()
+        response = pager.nextScenes() # Scenes parsed while the page is downloading
+        if response is None:
+          break
+        if response['isOk']:
+          cache.add( response['scenes'] )
+        addFeatures( response )
         msg = "Adding {0} features...".format( self.total_features_scenes )
         self.mbcancel.message( msg )
+      pager.finish()
+      if self.mbcancel.isCancel or self.hasCriticalMessage or self.layerTree is None:
+        cache.rollback()
+      else:
+        cache.commit()
 
       finished()
 
@@ -603,10 +857,28 @@ class CatalogPL(QtCore.QObject):
 
     self.enableRun.emit( False )
 
+    item_types = get_item_types()
+    geometry_config = extentFilter()
+    keyAOI = MarkSearch.getKey( item_types, geometry_config )
+    markAcquired = getMarkAcquired() # None: full search in new catalog
+    if not markAcquired is None:
+      self.hasCriticalMessage = False
+      populateLayer() # Upsert in current catalog
+      self.legendCatalogLayer.selectionChanged() # Update totals
+      self.enableRun.emit( True )
+      return
+    if self.settings['incremental'] and not self.layerTree is None:
+      if QtGui.QMessageBox.Yes != dialogReplaceCatalog():
+        msg = "Search canceled, the current catalog was kept"
+        self.msgBar.pushMessage( CatalogPL.pluginName, msg, QgsGui.QgsMessageBar.INFO, 4 )
+        self.enableRun.emit( True )
+        return
+
     # Setting Layer
     if not self.layer is None:
       QgsCore.QgsMapLayerRegistry.instance().removeMapLayer( self.layer.id() )
     createLayer()
+    self.indexAssets.clear()
     self.layerTree.setVisible(QtCore.Qt.Unchecked)
 
     if not checkLayerLegend():
@@ -620,29 +892,21 @@ class CatalogPL(QtCore.QObject):
     self.enableRun.emit( True )
 
   def getTotalAssets(self):
-    iterFeat = self.layer.selectedFeaturesIterator()
-    if self.layer.selectedFeatureCount() == 0:
-      iterFeat = self.layer.getFeatures()
-
-    totalAssets = {
-      'analytic': { 'images': 0, 'activate': 0 },
-      'udm':      { 'images': 0, 'activate': 0 }
-    }
-    for feat in iterFeat:  
-      meta_json = json.loads( feat['meta_json'] )
-      valuesAssets = self._getValuesAssets( meta_json['assets_status'] )
-
-      self._calculateTotalAsset('analytic', valuesAssets, totalAssets )
-      self._calculateTotalAsset('udm', valuesAssets, totalAssets )
+    return self.indexAssets.getTotalAssets()
 
-    return totalAssets 
+  def _selectionChanged(self, selected, deselected, clearAndSelect):
+    # Before LegendCatalogLayer.selectionChanged( connected after ), only the changes of selection
+    self.indexAssets.select( selected, deselected, clearAndSelect )
 
   @QtCore.pyqtSlot(str)
   def layerWillBeRemoved(self, id):
     if not self.layerTree is None and id == self.layer.id():
       self.apiPL.kill()
+      self.schedulerActivate.kill() # Kill all of poolAPI
+      self.pipeline.kill()
       self.worker.kill()
       self.legendCatalogLayer.clean()
+      self.indexAssets.clear()
       self.layerTree = self.layer = None
 
   @QtCore.pyqtSlot()
@@ -704,124 +968,154 @@ class CatalogPL(QtCore.QObject):
     self.thread.start() # Start Worker
     #self.worker.run() #DEBUGER
 
+  @staticmethod
+  def _isFreshAssets(meta_json):
+    # Status of assets can be reused: active with location or not exist, not expired and not old
+    def isFresh(asset):
+      status = assets_status.get( asset, {} )
+      if status.get('status') == '*None*':
+        return True
+      if status.get('status') != 'active' or not status.has_key('location'):
+        return False
+      if status.has_key('expires_at'):
+        return datetime.datetime.strptime( status['expires_at'], formatDateTime ) > datetime.datetime.utcnow()
+      return True
+
+    formatDateTime = '%Y-%m-%d %H:%M:%S' # See API_PlanetLabs.getAssetsStatus
+    assets_status = json.loads( meta_json ).get('assets_status', {} )
+    if not assets_status.has_key('date_calculate'):
+      return False
+    date_calculate = datetime.datetime.strptime( assets_status['date_calculate'], formatDateTime )
+    if ( datetime.datetime.now() - date_calculate ).total_seconds() > CatalogPL.assetsMaxAge:
+      return False
+    return isFresh('a_analytic') and isFresh('a_udm')
+
   @QtCore.pyqtSlot()
   def calculateAssetStatus(self):
-    @QtCore.pyqtSlot( dict )
-    def finished( response ):
-      if self.mbcancel.isCancel:
-        self.messagePL = None
-      else:
-        self.messagePL = response['assets_status']
-      loop.quit()
+    self._runAssetStatus()
 
-    r = self._startProcess( self.apiPL.kill )
+  @QtCore.pyqtSlot()
+  def refreshAssetStatus(self):
+    self._runAssetStatus( True )
+
+  def _runAssetStatus(self, onlyStale=False):
+    def requestNext(api):
+      # Return False if not have more features
+      if self.mbcancel.isCancel or self.layerTree is None:
+        return False
+      for feat in iterFeat:
+        if onlyStale and CatalogPL._isFreshAssets( feat['meta_json'] ):
+          dataLocal['step'] += 1
+          self.mbcancel.step( dataLocal['step'] )
+          continue
+        ( ok, item_type ) = self._getItemType( feat )
+        if not ok:
+          dataLocal['totalError'] += 1
+          dataLocal['step'] += 1
+          self.mbcancel.step( dataLocal['step'] )
+          continue
+        dataLocal['running'] += 1
+        item = { 'fid': feat.id(), 'id': feat['id'], 'meta_json': feat['meta_json'] }
+        api.getAssetsStatus( item_type, item['id'], lambda response: finished( api, item, response ) )
+        return True
+      return False
+
+    def finished(api, item, response):
+      dataLocal['running'] -= 1
+      if not self.mbcancel.isCancel and not self.layerTree is None:
+        dataLocal['step'] += 1
+        self.mbcancel.step( dataLocal['step'] )
+        if response['isOk']:
+          setStatus( item, response['assets_status'] )
+        else:
+          arg = ( item['id'], response['message'], response['errorCode'] )
+          msg = "Error request for {0}: {1} (Code = {2})".format( *arg )
+          self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
+          dataLocal['totalError'] += 1
+      if not requestNext( api ) and dataLocal['running'] == 0:
+        loop.quit()
+
+    def setStatus(item, assets_status):
+      meta_json = json.loads( item['meta_json'] )
+      meta_json['assets_status'] = assets_status
+      self.indexAssets.set( item['fid'], self._getValuesAssets( assets_status ) )
+      changes[ item['fid'] ] = CatalogPL._getValuesMetadata( meta_json, idsMetadata )
+      changes[ item['fid'] ][ id_meta_json ] = json.dumps( meta_json )
+      if not self._changeAttributes( changes ):
+        dataLocal['totalError'] += 1
+
+    def kill():
+      for api in self.poolAPI:
+        api.kill()
+
+    r = self._startProcess( kill )
     if not r['isOk']:
       return
     iterFeat = r['iterFeat']
 
     id_meta_json = self.layer.fieldNameIndex('meta_json')
-    id_meta_html = self.layer.fieldNameIndex('meta_html')
-    isEditable = self.layer.isEditable()
-    if not isEditable:
-      self.layer.startEditing()
-    totalAssets = {
-      'analytic': { 'images': 0, 'activate': 0 },
-      'udm':      { 'images': 0, 'activate': 0 }
-    }
+    idsMetadata = filter( lambda item: item[1][0] == 'assets_status', self._getIdsMetadata() )
+    changes = {} # Batch for provider
     loop = QtCore.QEventLoop()
-    step = totalError = 0
-    for feat in iterFeat:  
-      step += 1
-      self.mbcancel.step( step )
-      meta_json = json.loads( feat['meta_json'] )
-      ( ok, item_type ) = API_PlanetLabs.getValue( meta_json, [ 'item_type' ] )
-      if not ok:
-        totalError += 1
-        continue
-      self.apiPL.getAssetsStatus( item_type, feat['id'], finished )
-      loop.exec_()
-      if self.mbcancel.isCancel or self.layerTree is None :
-        step -= 1
-        iterFeat.close()
+    dataLocal = { 'totalError': 0, 'step': 0, 'running': 0 }
+    for api in self.poolAPI: # Requests in flight, the results are applied as they arrive
+      if not requestNext( api ):
         break
-      meta_json['assets_status'] = self.messagePL
-      valuesAssets = self._getValuesAssets( meta_json['assets_status'] )
-      self._calculateTotalAsset('analytic', valuesAssets, totalAssets )
-      self._calculateTotalAsset('udm', valuesAssets, totalAssets )
-      meta_html = API_PlanetLabs.getHtmlTreeMetadata( meta_json, '')
-      vjson = json.dumps( meta_json )
-      self.messagePL.clear()
-      self.messagePL = None
-      if not self.layer.changeAttributeValue( feat.id(), id_meta_json, vjson ):
-        totalError += 1
-      if not self.layer.changeAttributeValue( feat.id(), id_meta_html, meta_html ):
-        totalError += 1
-
-    self.layer.commitChanges()
-    if isEditable:
-      self.layer.startEditing()
+    if dataLocal['running'] > 0:
+      loop.exec_()
+    iterFeat.close()
+    if not self.layerTree is None and not self._changeAttributes( changes, True ):
+      dataLocal['totalError'] += 1
 
-    self._endProcessing( "Calculate Asset Status", totalError )
-    self.legendCatalogLayer.setAssetImages( totalAssets )
+    nameProcessing = "Refresh Asset Status" if onlyStale else "Calculate Asset Status"
+    self._endProcessing( nameProcessing, dataLocal['totalError'] )
+    self.legendCatalogLayer.setAssetImages( self.getTotalAssets() )
 
   ## Its is for API V0! Not update
   
   @QtCore.pyqtSlot()
   def activateAssets(self):
-    def activeAsset(asset, activate, dataLocal):
-      def setFinished( response ):
-        if not response[ 'isOk' ] and not self._hasLimiteErrorOK(response ):
-          r =  self._hasErrorDownloads(response)
-          if r['isOk']:
-            arg = ( self.currentItem, r['message'] )
-            msg = "Error request for {0}: {1}".format( *arg )
-          else:
-            arg = ( self.currentItem, response['message'], response[ 'errorCode' ] )
-            msg = "Error request for {0}: {1} (Code = {2})".format( *arg )
-          self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
-          self.currentItem = None
-          self.isOkPL = False
-        loop.quit()
-
+    def setFinished(item, response):
+      dataLocal['step'] += 1
       self.mbcancel.step( dataLocal['step'] )
-      if self.mbcancel.isCancel or self.layerTree is None :
-        dataLocal['step'] -= 1
-        iterFeat.close()
-        return False
-      self.currentItem = "'{0}({1})'".format( feat['id'], asset )
-      self.isOkPL = True
-      self.apiPL.activeAsset( activate, setFinished )
-      loop.exec_()
-      if not self.isOkPL:
+      if not response[ 'isOk' ] and not self._hasLimiteErrorOK(response ):
+        r =  self._hasErrorDownloads(response)
+        if r['isOk']:
+          arg = ( item['name'], r['message'] )
+          msg = "Error request for {0}: {1}".format( *arg )
+        else:
+          arg = ( item['name'], response['message'], response[ 'errorCode' ] )
+          msg = "Error request for {0}: {1} (Code = {2})".format( *arg )
+        self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
         dataLocal['totalError'] += 1
-      return True # Not cancel by user
-    
-    #msg = "Sorry! I am working this feature for API Planet V1"
-    #self.msgBar.pushMessage( CatalogPL.pluginName, msg, QgsGui.QgsMessageBar.CRITICAL, 8 )
-    #return
-    r = self._startProcess( self.apiPL.kill )
+
+    r = self._startProcess( self.schedulerActivate.kill )
     if not r['isOk']:
       return
     iterFeat = r['iterFeat']
 
-    dataLocal = { 'totalError': 0, 'step': 0 }
-    loop = QtCore.QEventLoop()
+    items = []
     for feat in iterFeat:
-      dataLocal['step'] += 1
-      meta_json = json.loads( feat['meta_json'] )
-      valuesAssets = self._getValuesAssets( meta_json['assets_status'] )
-      asset = 'analytic'
-      if valuesAssets[ asset ]['isOk'] and \
-         valuesAssets[ asset ]['status'] == 'inactive' and \
-         valuesAssets[ asset ].has_key('activate'):
-        if not activeAsset( asset, valuesAssets[ asset ]['activate'], dataLocal ):
-          break # Cancel by user
-      asset = 'udm'
-      if valuesAssets[ asset ]['isOk'] and \
-         valuesAssets[ asset ]['status'] == 'inactive' and \
-         valuesAssets[ asset ].has_key('activate'):
-        if not activeAsset( asset, valuesAssets[ asset ]['activate'], dataLocal ):
-          break # Cancel by user
+      valuesAssets = self._getValuesAssetsFeature( feat )
+      for asset in ( 'analytic', 'udm' ):
+        if valuesAssets[ asset ]['isOk'] and \
+           valuesAssets[ asset ]['status'] == 'inactive' and \
+           valuesAssets[ asset ].has_key('activate'):
+          name = "'{0}({1})'".format( feat['id'], asset )
+          items.append( { 'name': name, 'url': valuesAssets[ asset ]['activate'] } )
+
+    dataLocal = { 'totalError': 0, 'step': 0 }
+    if len( items ) > 0:
+      self.mbcancel.setMaximum( len( items ) )
+      loop = QtCore.QEventLoop()
+      self.schedulerActivate.finished.connect( loop.quit )
+      if self.schedulerActivate.start( items, setFinished ): # Concurrent requests under rate limit
+        loop.exec_()
+      else:
+        msg = "Requests of previous processing are running, try again later"
+        self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
+        dataLocal['totalError'] += len( items )
+      self.schedulerActivate.finished.disconnect( loop.quit )
 
     self._endProcessing( "Activate assets", dataLocal['totalError'] ) 
 
@@ -834,6 +1128,10 @@ class CatalogPL(QtCore.QObject):
       self._sortNameGroupCatalog()
       self._endProcessing( "Create TMS", message['totalError'] )
 
+    def getURL(feat, sbands):
+      ( ok, item_type ) = CatalogPL._getItemType( feat )
+      return API_PlanetLabs.getURL_TMS( item_type, feat['id'] )
+
     self._setGroupCatalog('TMS')
     r = self._startProcess( self.worker.kill )
     if not r['isOk']:
@@ -849,13 +1147,13 @@ class CatalogPL(QtCore.QObject):
     self.worker.finished.connect( finished )
     data = {
       'pluginName': CatalogPL.pluginName,
-      'getURL': API_PlanetLabs.getURL_TMS,
+      'getURL': getURL,
       'user_pwd': { 'user': API_PlanetLabs.validKey, 'pwd': '' }, 
       'path': path_tms,
       'ltgCatalog': self.catalog['ltg'],
       'id_layer': self.layer.id(),
       'ctTMS': ctTMS,
-      'iterFeat': iterFeat # feat: 'id', 'acquired', 'meta_json'
+      'iterFeat': iterFeat # feat: 'id', 'acquired', 'item_type', 'meta_json'
     }
     self.worker.setting( data )
     
@@ -878,10 +1176,8 @@ class CatalogPL(QtCore.QObject):
 
     def createThumbnails():
       self.currentItem = feat['id']
-      arg = ( feat['meta_json'], ['item_type'] )
-      ( ok, item_type ) = API_PlanetLabs.getValue( *arg )
+      ( ok, item_type ) = self._getItemType( feat )
       if not ok:
-        totalError += 1
         response = { 'isOk': False, 'errorCode': -1, 'message': item_type }
         setFinished( response )
       else:
@@ -898,9 +1194,7 @@ class CatalogPL(QtCore.QObject):
     path_thumbnail = os.path.join( self.settings['path'], 'thumbnail')
     if not os.path.exists( path_thumbnail ):
       os.makedirs( path_thumbnail )
-    isEditable = self.layer.isEditable()
-    if not isEditable:
-      self.layer.startEditing()
+    changes = {} # Batch for provider
     loop = QtCore.QEventLoop()
     for feat in iterFeat:
       step += 1
@@ -921,86 +1215,42 @@ class CatalogPL(QtCore.QObject):
           if not isOk:
             totalError += 1
           else:
-            arg = ( feat.id(), id_thumbnail, file_thumbnail  ) 
-            self.layer.changeAttributeValue( *arg ) 
+            changes[ feat.id() ] = { id_thumbnail: file_thumbnail }
         else:
           totalError += 1
       else:
-        arg = ( feat.id(), id_thumbnail, file_thumbnail  )
-        self.layer.changeAttributeValue( *arg )
+        changes[ feat.id() ] = { id_thumbnail: file_thumbnail }
+      if not self._changeAttributes( changes ):
+        totalError += 1
 
-    self.layer.commitChanges()
-    if isEditable:
-      self.layer.startEditing()
+    if not self.layerTree is None and not self._changeAttributes( changes, True ):
+      totalError += 1
 
     self._endProcessing( "Download Thumbnails", totalError ) 
 
   @QtCore.pyqtSlot()
   def downloadImages(self):
-    def createImage(suffix, location, id_table, geom, v_crs, acquired, id_image, dataLocal, add_image=False):
-      def setFinished( response ):
-        self.imageDownload.flush()
-        self.imageDownload.close()
-        if not response[ 'isOk' ] and not self._hasLimiteErrorOK(response ):
-          r =  self._hasErrorDownloads(response)
-          if r['isOk']:
-            arg = ( self.currentItem, r['message'] )
-            msg = "Error request for {0}: {1}".format( *arg )
-          else:
-            arg = ( self.currentItem, response['message'], response[ 'errorCode' ] )
-            msg = "Error request for {0}: {1} (Code = {2})".format( *arg )
-          self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
-          self.currentItem = None
-          self.isOkPL = False
-          self.totalReady = None
-          self.imageDownload.remove()
+    def setItem(item, response):
+      dataLocal['step'] += 1
+      self.mbcancel.step( dataLocal['step'], item['file'] )
+      if self.layerTree is None:
+        return
+      if not response[ 'isOk' ] and not self._hasLimiteErrorOK( response ):
+        r =  self._hasErrorDownloads( response )
+        if r['isOk']:
+          arg = ( item['item_id'], item['asset'], r['message'] )
+          msg = "Error request for '{0}({1})': {2}".format( *arg )
         else:
-          self.totalReady = response[ 'totalReady' ]
-          fileName = self.imageDownload.fileName()
-          self.imageDownload.rename( '.'.join( fileName.rsplit('.')[:-1] ) )
-        del self.imageDownload
-        self.imageDownload = None
-        loop.quit()
-
-      def addImage():
-        layer = QgsCore.QgsRasterLayer( file_image, os.path.split( file_image )[-1] )
-        geomTransf = QgsCore.QgsGeometry( geom )
-        ct = QgsCore.QgsCoordinateTransform( v_crs, layer.crs() )
-        geomTransf.transform( ct )
-        wkt_geom = geomTransf.exportToWkt()
-        layer.setCustomProperty( 'wkt_geom', wkt_geom )
-        layer.setCustomProperty( 'date', acquired )
-        layer.setCustomProperty( 'id_table', id_table )
-        layer.setCustomProperty( 'id_image', id_image )
-        QgsCore.QgsMapLayerRegistry.instance().addMapLayer( layer, addToLegend=False )
-        self.catalog['ltg'].addLayer( layer )
-        self.legendRasterGeom.setLayer( layer )
-      
-      arg = ( path_img, u"{0}_{1}.tif".format( feat['id'], suffix ) )
-      file_image = os.path.join( *arg )
-      self.mbcancel.step( dataLocal['step'], file_image )
-      if self.mbcancel.isCancel or self.layerTree is None :
-        dataLocal['step'] -= 1
-        iterFeat.close()
-        return False
-      self.isOkPL = True
-      if not QtCore.QFile.exists( file_image ):
-        self.currentItem = "'{0}({1})'".format( feat['id'], suffix )
-        self.imageDownload = QtCore.QFile( "{0}.part".format( file_image ) )
-        self.imageDownload.open( QtCore.QIODevice.WriteOnly )
-        arg = ( location, setFinished, self.imageDownload.write, self.mbcancel.stepFile )
-        self.apiPL.saveImage( *arg )
-        loop.exec_()
-        if not self.isOkPL:
-          dataLocal['totalError'] += 1
-      if add_image and self.isOkPL:
-        files_in_map = map( lambda item: item.layer().source(), dataLocal['ltgRoot'].findLayers() )
-        if not file_image in files_in_map:
-          addImage()
-      return True # Not cancel by user
+          arg = ( item['item_id'], item['asset'], response['message'], response[ 'errorCode' ] )
+          msg = "Error request for '{0}({1})': {2} (Code = {3})".format( *arg )
+        self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
+        dataLocal['totalError'] += 1
+      elif item['asset'] == 'analytic':
+        arg = ( item['file'], item['geom'], crsLayer, item['acquired'], id_table, item['item_id'] )
+        self._addImageCatalog( *arg )
 
     self._setGroupCatalog('TIF')
-    r = self._startProcess( self.worker.kill, True )
+    r = self._startProcess( self.downloadManager.kill, True )
     if not r['isOk']:
       return
     iterFeat = r['iterFeat']
@@ -1011,32 +1261,154 @@ class CatalogPL(QtCore.QObject):
       
     crsLayer = self.layer.crs()
     id_table = self.layer.id()
-    ltgRoot = QgsCore.QgsProject.instance().layerTreeRoot()
-    dataLocal = { 'totalError': 0, 'step': 0, 'ltgRoot': ltgRoot }
-    self.totalReady = None
-    loop = QtCore.QEventLoop()
+    assets = ( 'analytic', 'udm' ) if self.settings['udm'] else ( 'analytic', )
+    items = []
+    dataLocal = { 'totalError': 0, 'step': 0 }
     for feat in iterFeat:
-      dataLocal['step'] += 1
-      meta_json = json.loads( feat['meta_json'] )
-      valuesAssets = self._getValuesAssets( meta_json['assets_status'] )
-      arg_core = [ id_table, feat.geometry(), crsLayer, feat['acquired'], feat['id'], dataLocal ]
-      asset = 'analytic'
-      if valuesAssets[ asset ]['isOk'] and valuesAssets[ asset ].has_key('location'):
-        arg_base = [ valuesAssets[ asset ]['location'] ] + arg_core
-        arg = [ asset ] + arg_base + [ True ] 
-        if not createImage( *arg ):
-          break # Cancel by user
-      if self.settings['udm']:
-        asset = 'udm'
-        if valuesAssets[ asset ]['isOk'] and valuesAssets[ asset ].has_key('location'):
-          arg_base = [ valuesAssets[ asset ]['location'] ] + arg_core
-          arg = [ asset] + arg_base
-          if not createImage( *arg ):
-            break # Cancel by user
+      valuesAssets = self._getValuesAssetsFeature( feat )
+      valuesOrder = self._getValuesOrder( feat )
+      for asset in assets:
+        if not valuesAssets[ asset ]['isOk'] or not valuesAssets[ asset ].has_key('location'):
+          continue
+        item = {
+          'url': valuesAssets[ asset ]['location'], 'md5': valuesAssets[ asset ].get('md5'),
+          'item_id': feat['id'], 'asset': asset,
+          'acquired': feat['acquired'], 'wkt': feat.geometry().exportToWkt(),
+          'file': os.path.join( path_img, u"{0}_{1}.tif".format( feat['id'], asset ) )
+        }
+        item.update( valuesOrder )
+        items.append( item )
+    # Queue with the jobs not finished of previous sessions
+    journal = JournalDownloads( path_img )
+    journal.add( items )
+    current = dict( ( item['file'], item ) for item in items )
+    request = QgsCore.QgsFeatureRequest().setFlags( QgsCore.QgsFeatureRequest.NoGeometry )
+    request.setSubsetOfAttributes( [ 'id' ], self.layer.pendingFields() )
+    itemIds = set( feat['id'] for feat in self.layer.getFeatures( request ) ) # Jobs of other catalogs are kept
+    items = [ current.get( item['file'], item ) for item in journal.getResume( itemIds ) ]
+    for item in items:
+      item['geom'] = QgsCore.QgsGeometry.fromWkt( item['wkt'] )
+    self._setPriorities( items )
+
+    self.mbcancel.setMaximum( len( items ) )
+    loop = QtCore.QEventLoop()
+    self.downloadManager.finished.connect( loop.quit )
+    self.downloadManager.start( items, setItem, self.mbcancel.stepFile, journal )
+    if self.downloadManager.isRunning():
+      loop.exec_()
+    self.downloadManager.finished.disconnect( loop.quit )
+    self.downloadManager.finish() # Thread of writer
+    summary = journal.getSummary()
+    journal.close()
+    states = ', '.join( "{0} {1}".format( v, k ) for k, v in sorted( summary['states'].iteritems() ) )
+    arg = ( journal.fileDb, states, summary['bytes'] / 1048576.0, summary['throughput'] / 1048576.0 )
+    msg = "Journal of downloads '{0}': {1} - {2:.1f} MB downloaded at {3:.2f} MB/s by transfer".format( *arg )
+    self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.INFO )
 
     self._sortNameGroupCatalog()
     self._endProcessing( "Download Images", dataLocal['totalError'] ) 
 
+  @QtCore.pyqtSlot()
+  def clearJournal(self):
+    def dialogQuestion():
+      title = "Planet Labs"
+      msg = "Are you sure want clear the journal of downloads( the jobs not finished will not be resumed )?"
+      msgBox = QtGui.QMessageBox( QtGui.QMessageBox.Question, title, msg, QtGui.QMessageBox.Yes | QtGui.QMessageBox.No,  self.mainWindow )
+      msgBox.setDefaultButton( QtGui.QMessageBox.No )
+      return msgBox.exec_()
+
+    path_img = os.path.join( self.settings['path'], 'tif')
+    if not os.path.exists( os.path.join( path_img, JournalDownloads.fileName ) ):
+      msg = "Not have journal of downloads."
+      self.msgBar.pushMessage( CatalogPL.pluginName, msg, QgsGui.QgsMessageBar.INFO, 4 )
+      return
+
+    if QtGui.QMessageBox.Yes == dialogQuestion():
+      journal = JournalDownloads( path_img )
+      total = journal.clear()
+      journal.close()
+      msg = "Cleared the journal of downloads (total = {0})".format( total )
+      self.msgBar.pushMessage( CatalogPL.pluginName, msg, QgsGui.QgsMessageBar.INFO, 4 )
+
+  @QtCore.pyqtSlot()
+  def activateDownloadImages(self):
+    def setStatus(item, assets_status):
+      # Status of assets of scene in catalog
+      if self.layerTree is None:
+        return
+      request = QgsCore.QgsFeatureRequest( item['fid'] ).setFlags( QgsCore.QgsFeatureRequest.NoGeometry )
+      meta_json = json.loads( self.layer.getFeatures( request ).next()['meta_json'] )
+      meta_json['assets_status'] = assets_status
+      self.indexAssets.set( item['fid'], self._getValuesAssets( assets_status ) )
+      changes[ item['fid'] ] = CatalogPL._getValuesMetadata( meta_json, idsMetadata )
+      changes[ item['fid'] ][ id_meta_json ] = json.dumps( meta_json )
+      self._changeAttributes( changes, True ) # Read by next status of scene
+
+    def setItem(item, response):
+      dataLocal['step'] += 1
+      self.mbcancel.step( dataLocal['step'], item['file'] )
+      if self.layerTree is None:
+        return
+      if not response[ 'isOk' ] and not self._hasLimiteErrorOK( response ):
+        arg = ( item['item_id'], item['asset'], response['message'], response[ 'errorCode' ] )
+        msg = "Error request for '{0}({1})': {2} (Code = {3})".format( *arg )
+        self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
+        dataLocal['totalError'] += 1
+      elif item['asset'] == 'analytic':
+        arg = ( item['file'], item['geom'], crsLayer, item['acquired'], id_table, item['item_id'] )
+        self._addImageCatalog( *arg )
+
+    self._setGroupCatalog('TIF')
+    r = self._startProcess( self.pipeline.kill, True )
+    if not r['isOk']:
+      return
+    iterFeat = r['iterFeat']
+
+    path_img = os.path.join( self.settings['path'], 'tif')    
+    if not os.path.exists( path_img ):
+      os.makedirs( path_img )
+    crsLayer = self.layer.crs()
+    id_table = self.layer.id()
+    id_meta_json = self.layer.fieldNameIndex('meta_json')
+    idsMetadata = filter( lambda item: item[1][0] == 'assets_status', self._getIdsMetadata() )
+    assets = ( 'analytic', 'udm' ) if self.settings['udm'] else ( 'analytic', )
+    items, changes = [], {}
+    dataLocal = { 'totalError': 0, 'step': 0 }
+    for feat in iterFeat:
+      ( ok, item_type ) = self._getItemType( feat )
+      if not ok:
+        dataLocal['totalError'] += 1
+        continue
+      valuesAssets = self._getValuesAssetsFeature( feat )
+      valuesOrder = self._getValuesOrder( feat )
+      for asset in assets:
+        item = {
+          'fid': feat.id(), 'item_id': feat['id'], 'item_type': item_type, 'asset': asset,
+          'status': valuesAssets[ asset ], 'acquired': feat['acquired'], 'geom': feat.geometry(),
+          'file': os.path.join( path_img, u"{0}_{1}.tif".format( feat['id'], asset ) )
+        }
+        item.update( valuesOrder )
+        items.append( item )
+    self._setPriorities( items ) # Order of activation and download
+
+    self.mbcancel.setMaximum( len( items ) )
+    loop = QtCore.QEventLoop()
+    self.pipeline.finished.connect( loop.quit )
+    arg = { 'setStatus': setStatus, 'setItem': setItem, 'setProgress': self.mbcancel.stepFile }
+    if not self.pipeline.start( items, arg ): # Activation and polling overlap the downloads
+      msg = "Requests of previous processing are running, try again later"
+      self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
+      dataLocal['totalError'] += len( items )
+    elif self.pipeline.isRunning():
+      loop.exec_()
+    self.pipeline.finished.disconnect( loop.quit )
+    self.downloadManager.finish() # Thread of writer
+
+    self._sortNameGroupCatalog()
+    self._endProcessing( "Activate and download images", dataLocal['totalError'] ) 
+    if not self.layerTree is None:
+      self.legendCatalogLayer.setAssetImages( self.getTotalAssets() )
+
   @staticmethod
   def copyExpression():
     dirname = os.path.dirname
@@ -1047,3 +1419,5 @@ class CatalogPL(QtCore.QObject):
       if QtCore.QFile.exists( toExp ):
         QtCore.QFile.remove( toExp ) 
       QtCore.QFile.copy( fromExp, toExp ) 
+    if not QgsCore.QgsExpression.isFunctionName('getHtmlMetadata'): # Expressions of user are loaded when QGIS starts
+      import pl_expressions # Registered by import, used by 'meta_html'
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Catalog Store
+Description          : Catalog of scenes in disk (GeoPackage)
+Date                 : October, 2026
+copyright            : (C) 2015 by Luiz Motta
+email                : motta.luiz@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os, re
+
+from osgeo import ogr, osr
+
+
+class CatalogStoreGPKG(object):
+  # GeoPackage of catalog, fields as URI of memory provider
+
+  dirName = 'catalog_pl'
+  layerName = 'scenes'
+  typesOGR = { 'string': ogr.OFTString, 'integer': ogr.OFTInteger, 'double': ogr.OFTReal }
+
+  def __init__(self, path):
+    self.path = os.path.join( path, CatalogStoreGPKG.dirName )
+    if not os.path.exists( self.path ):
+      os.makedirs( self.path )
+
+  def getFile(self, name):
+    # Catalogs saved before are kept, the name has a counter suffix
+    name = re.sub( r'[^\w\-]+', '_', name ).strip('_')
+    fileStore = os.path.join( self.path, "{0}.gpkg".format( name ) )
+    count = 1
+    while os.path.exists( fileStore ):
+      fileStore = os.path.join( self.path, "{0}_{1}.gpkg".format( name, count ) )
+      count += 1
+    return fileStore
+
+  def create(self, name, fields, indexes=[]):
+    # Return { 'isOk', 'message', 'uri'( OGR ) }
+    fileStore = self.getFile( name )
+    driver = ogr.GetDriverByName('GPKG')
+    if driver is None:
+      return { 'isOk': False, 'message': "Driver GPKG of OGR not found" }
+    ds = driver.CreateDataSource( fileStore )
+    if ds is None:
+      return { 'isOk': False, 'message': "Can't create '{0}'".format( fileStore ) }
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG( 4326 )
+    options = [ 'SPATIAL_INDEX=YES', 'FID=fid', 'GEOMETRY_NAME=geom' ]
+    lyr = ds.CreateLayer( CatalogStoreGPKG.layerName, srs, ogr.wkbMultiPolygon, options )
+    for item in fields:
+      ( name, typeField ) = item.split(':')
+      length = 0
+      if '(' in typeField:
+        ( typeField, length ) = typeField[:-1].split('(')
+      field = ogr.FieldDefn( name, CatalogStoreGPKG.typesOGR[ typeField ] )
+      if typeField == 'string':
+        length = 0 # TEXT without limit
+      field.SetWidth( int( length ) )
+      lyr.CreateField( field )
+    sqls = [
+      "PRAGMA journal_mode=WAL",
+      "CREATE INDEX idx_{0}_id ON {0}(id)",
+      "CREATE INDEX idx_{0}_acquired ON {0}(acquired)"
+    ]
+    sqls += [ "CREATE INDEX idx_{{0}}_{0} ON {{0}}({0})".format( item ) for item in indexes ]
+    for sql in sqls:
+      ds.ExecuteSQL( sql.format( CatalogStoreGPKG.layerName ) )
+    ds = None # Close
+
+    uri = "{0}|layername={1}".format( fileStore, CatalogStoreGPKG.layerName )
+    return { 'isOk': True, 'uri': uri }
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Geometry WKB
+Description          : Geometries of footprints of scenes from GeoJSON coordinates by WKB
+Date                 : October, 2026
+copyright            : (C) 2015 by Luiz Motta
+email                : motta.luiz@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import struct, array, sys, time
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+from qgis import core as QgsCore
+
+
+class GeometryWKB(object):
+  # Footprints as WKB MultiPolygon, without QgsPoint by vertex
+
+  wkbPolygon, wkbMultiPolygon = 3, 6
+  headerPolygon = struct.pack( '<BI', 1, wkbPolygon ) # Little endian
+  useNumpy = not numpy is None
+  numpyVertices = 64 # Minimum of vertices of ring for use NumPy( overhead of array creation )
+
+  @staticmethod
+  def _packRing(ring):
+    if GeometryWKB.useNumpy and len( ring ) >= GeometryWKB.numpyVertices:
+      coords = numpy.asarray( ring, dtype='<f8' )[:, :2]
+      return struct.pack( '<I', len( coords ) ) + coords.tostring()
+    coords = array.array( 'd' )
+    for point in ring:
+      coords.append( point[0] )
+      coords.append( point[1] )
+    if sys.byteorder == 'big':
+      coords.byteswap()
+    return struct.pack( '<I', len( ring ) ) + coords.tostring()
+
+  @staticmethod
+  def _packPolygon(polygon):
+    rings = [ GeometryWKB._packRing( ring ) for ring in polygon ]
+    return GeometryWKB.headerPolygon + struct.pack( '<I', len( rings ) ) + ''.join( rings )
+
+  @staticmethod
+  def getWkb(geomItem):
+    # WKB of MultiPolygon or None for other types
+    coords = geomItem['coordinates']
+    if geomItem['type'] == 'Polygon':
+      polygons = [ coords ]
+    elif geomItem['type'] == 'MultiPolygon':
+      polygons = coords
+    else:
+      return None
+    parts = [ GeometryWKB._packPolygon( polygon ) for polygon in polygons ]
+    return struct.pack( '<BII', 1, GeometryWKB.wkbMultiPolygon, len( parts ) ) + ''.join( parts )
+
+  @staticmethod
+  def getGeometry(geomItem):
+    wkb = GeometryWKB.getWkb( geomItem )
+    if wkb is None:
+      return None
+    geom = QgsCore.QgsGeometry()
+    geom.fromWkb( wkb )
+    return geom
+
+  @staticmethod
+  def getGeometries(scenes):
+    # Geometries( None for not supported ) in order of scenes
+    return [ GeometryWKB.getGeometry( item['geometry'] ) for item in scenes ]
+
+
+def getGeometryPoints(geomItem):
+  # Previous path: one QgsPoint by vertex
+  geomCoords = geomItem['coordinates']
+  if geomItem['type'] == 'Polygon':
+    qpolygon = map ( lambda polyline: map( lambda item: QgsCore.QgsPoint( item[0], item[1] ), polyline ), geomCoords )
+    return QgsCore.QgsGeometry.fromMultiPolygon( [ qpolygon ] )
+  if geomItem['type'] == 'MultiPolygon':
+    qmultipolygon = []
+    for polygon in geomCoords:
+        qpolygon = map ( lambda polyline: map( lambda item: QgsCore.QgsPoint( item[0], item[1] ), polyline ), polygon )
+        qmultipolygon.append( qpolygon )
+    return QgsCore.QgsGeometry.fromMultiPolygon( qmultipolygon )
+  return None
+
+
+def benchmark(scenes, repeat=3):
+  # Seconds by QgsPoint, WKB/array and WKB/NumPy, use in Python console of QGIS
+  def best(func):
+    times = []
+    for i in xrange( repeat ):
+      t0 = time.time()
+      for item in scenes:
+        func( item['geometry'] )
+      times.append( time.time() - t0 )
+    return min( times )
+
+  ( useNumpy, numpyVertices ) = ( GeometryWKB.useNumpy, GeometryWKB.numpyVertices )
+  result = { 'scenes': len( scenes ), 'qgspoint': best( getGeometryPoints ) }
+  GeometryWKB.useNumpy = False
+  result['wkb_array'] = best( GeometryWKB.getGeometry )
+  if not numpy is None:
+    ( GeometryWKB.useNumpy, GeometryWKB.numpyVertices ) = ( True, 0 )
+    result['wkb_numpy'] = best( GeometryWKB.getGeometry )
+  ( GeometryWKB.useNumpy, GeometryWKB.numpyVertices ) = ( useNumpy, numpyVertices )
+  return result
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Index Assets
+Description          : Totals of assets of catalog updated by changes of status and selection
+Date                 : October, 2026
+copyright            : (C) 2015 by Luiz Motta
+email                : motta.luiz@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+
+class IndexAssets(object):
+  # Totals of assets by deltas, state by feature id
+
+  names = ( 'analytic', 'udm' )
+
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self.states = {}
+    self.selected = set()
+    self.totalAll = [ 0, 0, 0, 0 ]
+    self.totalSelected = [ 0, 0, 0, 0 ]
+
+  @staticmethod
+  def _getState(valuesAssets):
+    state = []
+    for name in IndexAssets.names:
+      asset = valuesAssets[ name ]
+      hasImage = asset['isOk'] and asset.has_key('location')
+      hasActivate = asset['isOk'] and asset['status'] == 'inactive' and asset.has_key('activate')
+      state += [ int( hasImage ), int( hasActivate ) ]
+    return tuple( state )
+
+  @staticmethod
+  def _addTotal(total, state, signal):
+    for i in xrange( len( state ) ):
+      total[ i ] += signal * state[ i ]
+
+  def set(self, fid, valuesAssets):
+    # valuesAssets: see CatalogPL._getValuesAssets
+    state = IndexAssets._getState( valuesAssets )
+    old = self.states.pop( fid, None )
+    if not old is None:
+      IndexAssets._addTotal( self.totalAll, old, -1 )
+      if fid in self.selected:
+        IndexAssets._addTotal( self.totalSelected, old, -1 )
+    if sum( state ) == 0:
+      return
+    self.states[ fid ] = state
+    IndexAssets._addTotal( self.totalAll, state, 1 )
+    if fid in self.selected:
+      IndexAssets._addTotal( self.totalSelected, state, 1 )
+
+  def select(self, selected, deselected, clearAndSelect):
+    # Deltas of QgsVectorLayer.selectionChanged
+    def update(fids, signal):
+      for fid in fids:
+        state = self.states.get( fid )
+        if not state is None:
+          IndexAssets._addTotal( self.totalSelected, state, signal )
+
+    if clearAndSelect:
+      self.selected = set()
+      self.totalSelected = [ 0, 0, 0, 0 ]
+    deselected = [ fid for fid in deselected if fid in self.selected ]
+    self.selected.difference_update( deselected )
+    update( deselected, -1 )
+    selected = [ fid for fid in selected if not fid in self.selected ]
+    self.selected.update( selected )
+    update( selected, 1 )
+
+  def getTotalAssets(self):
+    # Totals of selected features( or all without selection )
+    total = self.totalSelected if len( self.selected ) > 0 else self.totalAll
+    return {
+      'analytic': { 'images': total[0], 'activate': total[1] },
+      'udm':      { 'images': total[2], 'activate': total[3] }
+    }
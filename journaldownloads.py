@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Journal Downloads
+Description          : Queue of downloads of images in disk( SQLite ), kept between sessions of QGIS
+Date                 : October, 2026
+copyright            : (C) 2015 by Luiz Motta
+email                : motta.luiz@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os, time, sqlite3
+
+
+class JournalDownloads(object):
+  # Jobs of downloads by file in 'downloads.sqlite'
+
+  fileName = 'downloads.sqlite'
+  maxRetries = 3
+  columns = ( 'file', 'item_id', 'asset', 'url', 'md5', 'acquired', 'wkt' ) # Item of DownloadManager
+
+  def __init__(self, path):
+    self.fileDb = os.path.join( path, JournalDownloads.fileName )
+    self.conn = sqlite3.connect( self.fileDb )
+    sqls = [
+      "PRAGMA journal_mode=WAL",
+      "PRAGMA synchronous=NORMAL",
+      """CREATE TABLE IF NOT EXISTS jobs(
+        file TEXT PRIMARY KEY, item_id TEXT, asset TEXT, url TEXT, md5 TEXT, acquired TEXT, wkt TEXT,
+        state TEXT, retries INTEGER DEFAULT 0, message TEXT, bytes INTEGER,
+        added REAL, started REAL, finished REAL
+      )""",
+      "CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state)"
+    ]
+    for sql in sqls:
+      self.conn.execute( sql )
+    self.conn.commit()
+
+  def close(self):
+    self.conn.close()
+
+  def add(self, items):
+    # Jobs 'pending', update url and md5 of jobs added before( failed above maxRetries are kept )
+    now = time.time()
+    values = [ tuple( item.get( key ) for key in JournalDownloads.columns ) for item in items ]
+    sql = "INSERT OR IGNORE INTO jobs({0}, state, added) VALUES({1}, 'pending', {2})"
+    sql = sql.format( ', '.join( JournalDownloads.columns ), ', '.join( '?' * len( JournalDownloads.columns ) ), now )
+    self.conn.executemany( sql, values )
+    sql = "UPDATE jobs SET url = ?, md5 = ? WHERE file = ?"
+    self.conn.executemany( sql, [ ( item['url'], item.get('md5'), item['file'] ) for item in items ] )
+    sql = "UPDATE jobs SET state = 'pending', message = NULL, bytes = NULL, started = NULL, finished = NULL " \
+          "WHERE file = ? AND state != 'pending' AND NOT ( state = 'failed' AND retries >= ? )"
+    self.conn.executemany( sql, [ ( item['file'], JournalDownloads.maxRetries ) for item in items ] )
+    self.conn.commit()
+
+  def getResume(self, itemIds):
+    # Jobs not finished of items of catalog( itemIds )
+    sql = "SELECT {0} FROM jobs WHERE state IN ('pending', 'active') OR ( state = 'failed' AND retries < ? ) ORDER BY added"
+    sql = sql.format( ', '.join( JournalDownloads.columns ) )
+    cursor = self.conn.execute( sql, ( JournalDownloads.maxRetries, ) )
+    items = ( dict( zip( JournalDownloads.columns, row ) ) for row in cursor )
+    return [ item for item in items if item['item_id'] in itemIds ]
+
+  def clear(self):
+    # Return the total of jobs removed
+    total = self.conn.execute("DELETE FROM jobs").rowcount
+    self.conn.commit()
+    return total
+
+  def setActive(self, item):
+    sql = "UPDATE jobs SET state = 'active', started = ? WHERE file = ?"
+    self.conn.execute( sql, ( time.time(), item['file'] ) )
+    self.conn.commit()
+
+  def setFinished(self, item, response):
+    now = time.time()
+    if response['isOk'] and response.get('isExists'): # Not downloaded, out of throughput
+      sql = "UPDATE jobs SET state = 'done', message = NULL, bytes = NULL, started = NULL, finished = ? WHERE file = ?"
+      self.conn.execute( sql, ( now, item['file'] ) )
+    elif response['isOk']:
+      totalBytes = os.path.getsize( item['file'] ) if os.path.exists( item['file'] ) else 0
+      sql = "UPDATE jobs SET state = 'done', message = NULL, bytes = ?, finished = ? WHERE file = ?"
+      self.conn.execute( sql, ( totalBytes, now, item['file'] ) )
+    else:
+      message = "{0} (Code = {1})".format( response['message'], response.get('errorCode') )
+      sql = "UPDATE jobs SET state = 'failed', retries = retries + 1, message = ?, finished = ? WHERE file = ?"
+      self.conn.execute( sql, ( message, now, item['file'] ), )
+    self.conn.commit()
+
+  def getSummary(self):
+    # { 'states', 'bytes', 'seconds', 'throughput', 'failures' }
+    states = dict( self.conn.execute("SELECT state, count(*) FROM jobs GROUP BY state").fetchall() )
+    sql = "SELECT sum( bytes ), sum( finished - started ) FROM jobs WHERE state = 'done' AND bytes IS NOT NULL AND started IS NOT NULL"
+    ( totalBytes, seconds ) = self.conn.execute( sql ).fetchone()
+    ( totalBytes, seconds ) = ( totalBytes or 0, seconds or 0.0 )
+    sql = "SELECT file, retries, message FROM jobs WHERE state = 'failed' ORDER BY finished DESC"
+    return {
+      'states': states,
+      'bytes': totalBytes,
+      'seconds': seconds,
+      'throughput': totalBytes / seconds if seconds > 0 else 0.0,
+      'failures': self.conn.execute( sql ).fetchall()
+    }
@@ -28,6 +28,13 @@ from qgis import core as QgsCore, gui as QgsGui, utils as QgsUtils
 class DialogImageSettingPL(QtGui.QDialog):
 
   localSetting = "catalogpl_plugin" # ~/.config/QGIS/QGIS2.conf
+  downloadOrders = ( # ( key, label ), see CatalogPL._setPriorities
+    ( 'acquired', "Newest acquired" ),
+    ( 'cloud_cover', "Lowest cloud cover" ),
+    ( 'overlap', "Largest area in map view" ),
+    ( 'rank', "Rank (column 'rank' of catalog, lowest first)" ),
+    ( 'catalog', "Order of catalog" )
+  )
 
   def __init__(self, parent, icon=None, data=None):
     def initGui():
@@ -56,6 +63,10 @@ class DialogImageSettingPL(QtGui.QDialog):
         w = self.findChild( QtGui.QRadioButton, self.data['current_asset'] )
         w.setChecked(True)
         checkUdm.setChecked( self.data['udm'] )
+        checkRefresh.setChecked( self.data['force_refresh'] )
+        checkIncremental.setChecked( self.data['incremental'] )
+        checkStoreDisk.setChecked( self.data['store_disk'] )
+        comboOrder.setCurrentIndex( comboOrder.findData( self.data['download_order'] ) )
         buttonPath.setText( self.data['path'] )
         total = getSizeCacheTMS()
         if total > 0:
@@ -113,6 +124,14 @@ class DialogImageSettingPL(QtGui.QDialog):
 
       checkUdm = createCheckBox( 'Save UDM(Unusable Data Mask)', 'udm', grpImage )
 
+      lytOrder = QtGui.QHBoxLayout()
+      lytOrder.addWidget( QtGui.QLabel( 'Order of downloads', grpImage ) )
+      comboOrder = QtGui.QComboBox( grpImage )
+      comboOrder.setObjectName('download_order')
+      for ( key, label ) in self.downloadOrders:
+        comboOrder.addItem( label, key )
+      lytOrder.addWidget( comboOrder )
+
       buttonPath = QtGui.QPushButton( self.titleSelectDirectory, grpImage )
       buttonPath.setObjectName('path')
 
@@ -123,11 +142,12 @@ class DialogImageSettingPL(QtGui.QDialog):
       lytImage = QtGui.QVBoxLayout( grpImage )
       lytImage.addLayout( lytAssets )
       lytImage.addWidget( checkUdm )
+      lytImage.addLayout( lytOrder )
       lytImage.addWidget( buttonPath )
       lytImage.addWidget( buttonClearCache )
 
       grpDateSearch = QtGui.QGroupBox('Dates for search', self )
-      lytDate = QtGui.QHBoxLayout( grpDateSearch )
+      lytDate = QtGui.QHBoxLayout()
       date1 = createDateEdit('From', 'deDate1', grpDateSearch, lytDate )
       date2 = createDateEdit('To', 'deDate2', grpDateSearch, lytDate )
       spinDay = QtGui.QSpinBox( grpDateSearch )
@@ -137,6 +157,16 @@ class DialogImageSettingPL(QtGui.QDialog):
       spinDay.setRange( 1, 1000*360 )
       lytDate.addWidget( spinDay )
 
+      checkRefresh = createCheckBox( 'Force refresh (not use the cache of search)', 'force_refresh', grpDateSearch )
+      checkIncremental = createCheckBox( 'Incremental (add only the new images in current catalog)', 'incremental', grpDateSearch )
+      checkStoreDisk = createCheckBox( 'Catalog in disk (GeoPackage in directory for download)', 'store_disk', grpDateSearch )
+
+      lytSearch = QtGui.QVBoxLayout( grpDateSearch )
+      lytSearch.addLayout( lytDate )
+      lytSearch.addWidget( checkRefresh )
+      lytSearch.addWidget( checkIncremental )
+      lytSearch.addWidget( checkStoreDisk )
+
       buttonOK = QtGui.QPushButton('OK', self )
 
       layout = QtGui.QVBoxLayout( self )
@@ -246,12 +276,20 @@ class DialogImageSettingPL(QtGui.QDialog):
       QtGui.QMessageBox.information( self, "Missing directory for download", msg )
       return
     udm = self.findChild( QtGui.QCheckBox, 'udm' )
+    force_refresh = self.findChild( QtGui.QCheckBox, 'force_refresh' )
+    incremental = self.findChild( QtGui.QCheckBox, 'incremental' )
+    store_disk = self.findChild( QtGui.QCheckBox, 'store_disk' )
+    download_order = self.findChild( QtGui.QComboBox, 'download_order' )
     date1 = self.findChild( QtGui.QDateEdit, "deDate1" )
     date2 = self.findChild( QtGui.QDateEdit, "deDate2" )
     self.data = {
         'path': path,
         'current_asset': getCurrentNameAsset(),
         'udm': udm.isChecked(),
+        'force_refresh': force_refresh.isChecked(),
+        'incremental': incremental.isChecked(),
+        'store_disk': store_disk.isChecked(),
+        'download_order': download_order.itemData( download_order.currentIndex() ),
         'date1': date1.date(),
         'date2': date2.date()
     }
@@ -314,9 +352,12 @@ class LegendCatalogLayer():
     self.legendInterface = QgsUtils.iface.legendInterface()
     self.legendMenuIDs = {
       'calculate_status_assets': 'idCalculateStatusAssets',
+      'refresh_status_assets': 'idRefreshStatusAssets',
       'activate_assets': 'idActivateAssets',
       'create_tms': 'idCreateTMS',
       'download_images': 'idDownloadImages',
+      'activate_download_images': 'idActivateDownloadImages',
+      'clear_journal': 'idClearJournal',
       'download_thumbnails': 'idDownloadThumbnails'
     }
     self.legendLayer = self.layer = None
@@ -367,6 +408,12 @@ class LegendCatalogLayer():
           'slot': self.slots['calculate_status_assets'],
           'action': None
         },
+        {
+          'menu': u"Refresh status assets",
+          'id': self.legendMenuIDs['refresh_status_assets'],
+          'slot': self.slots['refresh_status_assets'],
+          'action': None
+        },
         {
           'menu': u"Activate assets",
           'id': self.legendMenuIDs['activate_assets'],
@@ -383,6 +430,18 @@ class LegendCatalogLayer():
           'slot': self.slots['download_images'],
           'action': None
         },
+        {
+          'menu': u"Activate and download images",
+          'id': self.legendMenuIDs['activate_download_images'],
+          'slot': self.slots['activate_download_images'],
+          'action': None
+        },
+        {
+          'menu': u"Clear journal of downloads",
+          'id': self.legendMenuIDs['clear_journal'],
+          'slot': self.slots['clear_journal'],
+          'action': None
+        },
         {
           'menu': u"Download thumbnails",
           'id': self.legendMenuIDs['download_thumbnails'],
@@ -397,7 +456,9 @@ class LegendCatalogLayer():
       }
       idsTotal = (
         self.legendMenuIDs['calculate_status_assets'],
+        self.legendMenuIDs['refresh_status_assets'],
         self.legendMenuIDs['create_tms'],
+        self.legendMenuIDs['activate_download_images'],
         self.legendMenuIDs['download_thumbnails']
       )
       for item in self.legendLayer:
@@ -475,7 +536,9 @@ class LegendCatalogLayer():
     prefixs = self._getPrefixs( totalAssets )
     idsTotal = (
       self.legendMenuIDs['calculate_status_assets'],
+      self.legendMenuIDs['refresh_status_assets'],
       self.legendMenuIDs['create_tms'],
+      self.legendMenuIDs['activate_download_images'],
       self.legendMenuIDs['download_thumbnails']
     )
     for item in self.legendLayer:
@@ -62,6 +62,12 @@ class MessageBarCancelProgress(QtCore.QObject):
     self.isCancel = False
     self.kill = funcKill
 
+  def setMaximum(self, maximum):
+    if self.pb is None:
+      return
+    self.maximum = maximum
+    self.pb.setMaximum( maximum )
+
   def step(self, value, image=None):
     if self.pb is None:
       return
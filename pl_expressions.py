@@ -21,6 +21,20 @@ email                : motta.luiz@gmail.com
 from qgis.core import ( qgsfunction )
 from catalogpl_plugin import API_PlanetLabs
 
+keysExpression = {} # 'list_keys' -> tuple of keys, compiled once by expression
+
+def getKeys(list_keys):
+  keys = keysExpression.get( list_keys )
+  if keys is None:
+    if list_keys.count('"') % 2 != 0:
+      raise Exception("Catalog Planet: Error! Key need double quotes: %s." % list_keys )
+    if len( list_keys ) < 1:
+      raise Exception("Catalog Planet: Error! Field is empty." )
+    lstKey = map( lambda item: item.strip(), list_keys.split(",") )
+    keys = tuple( map( lambda item: item.strip('"'), lstKey ) )
+    keysExpression[ list_keys ] = keys
+  return keys
+
 @qgsfunction(args=1, group='Planet Labs')
 def getValueFromMetadata(values, feature, parent):
   """
@@ -29,24 +43,16 @@ def getValueFromMetadata(values, feature, parent):
   <p><h4>Argument</h4>list_keys -> String with a sequence of keys names - '"key1","key2",...'</p>
   <p><h4>Example</h4>getValueFromMetadata( '"item_type"' )</p><p>Return: Item type</p>
   """
-  if values[0].count('"') % 2 != 0:
-    raise Exception("Catalog Planet: Error! Key need double quotes: %s." % values[0] )
-  
-  if len( values[0] ) < 1:
-    raise Exception("Catalog Planet: Error! Field is empty." )
-    
+  keys = getKeys( values[0] )
 
   name_metadata_json = 'meta_json'
   id_metadata_json = feature.fieldNameIndex( name_metadata_json )
   if id_metadata_json == -1:
     raise Exception("Catalog Planet: Error! Need have '%s' field." % name_metadata_json )
 
-  lstKey = map( lambda item: item.strip(), values[ 0 ].split(",") )
-  lstKey = map( lambda item: item.strip('"'), lstKey )
-
   metadata_json = feature.attributes()[ id_metadata_json ] 
   try:
-    ( success, valueKey) = API_PlanetLabs.getValue( metadata_json, lstKey )
+    ( success, valueKey) = API_PlanetLabs.getValueCache( feature.id(), metadata_json, keys )
     if not success:
       raise Exception( valueKey )
   except Exception as e:
@@ -68,10 +74,15 @@ def getLocationAnalytic(values, feature, parent):
   if id_metadata_json == -1:
     raise Exception("Catalog Planet: Error! Need have '%s' field." % name_metadata_json )
 
+  id_location = feature.fieldNameIndex('analytic_location') # Column of catalog
+  if id_location != -1:
+    valueKey = feature.attributes()[ id_location ]
+    return valueKey if valueKey else "'location' not found"
+
   metadata_json = feature.attributes()[ id_metadata_json ]
-  lstKey = ['assets_status','a_analytic','location'] 
+  keys = ( 'assets_status', 'a_analytic', 'location' )
   try:
-    ( success, valueKey) = API_PlanetLabs.getValue( metadata_json, lstKey )
+    ( success, valueKey) = API_PlanetLabs.getValueCache( feature.id(), metadata_json, keys )
     if not success:
       return "'location' not found"
   except Exception as e:
@@ -93,13 +104,34 @@ def getLocationUDM(values, feature, parent):
   if id_metadata_json == -1:
     raise Exception("Catalog Planet: Error! Need have '%s' field." % name_metadata_json )
 
+  id_location = feature.fieldNameIndex('udm_location') # Column of catalog
+  if id_location != -1:
+    valueKey = feature.attributes()[ id_location ]
+    return valueKey if valueKey else "'location' not found"
+
   metadata_json = feature.attributes()[ id_metadata_json ]
-  lstKey = ['assets_status','a_udm','location'] 
+  keys = ( 'assets_status', 'a_udm', 'location' )
   try:
-    ( success, valueKey) = API_PlanetLabs.getValue( metadata_json, lstKey )
+    ( success, valueKey) = API_PlanetLabs.getValueCache( feature.id(), metadata_json, keys )
     if not success:
       return "'location' not found"
   except Exception as e:
     pass
 
   return valueKey
+
+@qgsfunction(args=0, group='Planet Labs')
+def getHtmlMetadata(values, feature, parent):
+  """
+  <h4>Return</h4>HTML( tree ) of 'meta_json' field
+  <p><h4>Syntax</h4>getHtmlMetadata()</p>
+  <p><h4>Argument</h4>None</p>
+  <p><h4>Example</h4>getHtmlMetadata()</p><p>Return: HTML of metadata</p>
+  """
+
+  name_metadata_json = 'meta_json'
+  id_metadata_json = feature.fieldNameIndex( name_metadata_json )
+  if id_metadata_json == -1:
+    raise Exception("Catalog Planet: Error! Need have '%s' field." % name_metadata_json )
+
+  return API_PlanetLabs.getHtmlMetadata( feature.attributes()[ id_metadata_json ] )
@@ -11,7 +11,7 @@
       <widgetv2config Width="390" fieldEditable="0" Height="330" constraint="" labelOnTop="0" constraintDescription="" notNull="0"/>
     </edittype>
     <edittype widgetv2type="TextEdit" name="meta_html">
-      <widgetv2config IsMultiline="1" fieldEditable="1" constraint="" UseHtml="1" labelOnTop="0" constraintDescription="" notNull="0"/>
+      <widgetv2config IsMultiline="1" fieldEditable="0" constraint="" UseHtml="1" labelOnTop="0" constraintDescription="" notNull="0"/>
     </edittype>
     <edittype widgetv2type="Hidden" name="meta_json">
       <widgetv2config fieldEditable="1" constraint="" labelOnTop="0" constraintDescription="" notNull="0"/>
@@ -267,9 +267,9 @@
     <alias field="id" index="0" name=""/>
     <alias field="acquired" index="1" name=""/>
     <alias field="thumbnail" index="2" name=""/>
-    <alias field="meta_html" index="3" name=""/>
-    <alias field="meta_json" index="4" name=""/>
-    <alias field="meta_jsize" index="5" name=""/>
+    <alias field="meta_json" index="3" name=""/>
+    <alias field="meta_jsize" index="4" name=""/>
+    <alias field="meta_html" index="17" name=""/>
   </aliases>
   <excludeAttributesWMS/>
   <excludeAttributesWFS/>
@@ -319,7 +319,7 @@ def my_form_open(dialog, layer, feature):
       <attributeEditorField showLabel="0" index="2" name="thumbnail"/>
     </attributeEditorContainer>
     <attributeEditorContainer showLabel="1" visibilityExpressionEnabled="0" visibilityExpression="" name="Metadata" groupBox="0" columnCount="0">
-      <attributeEditorField showLabel="0" index="3" name="meta_html"/>
+      <attributeEditorField showLabel="0" index="17" name="meta_html"/>
     </attributeEditorContainer>
   </attributeEditorForm>
   <widgets/>
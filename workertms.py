@@ -177,6 +177,8 @@ class WorkerCreateTMS_ServerXYZ(QtCore.QObject): # Obsolete, need changes!
 
   @QtCore.pyqtSlot()
   def run(self):
+    from catalogpl import CatalogPL # Cycle of imports
+
     def addTMS():
       server_url = API_PlanetLabs.urlTMS.format( item_type=item_type, item_id=item_id )
       urlkey = "{0}?api_key={1}".format( server_url, user_pwd )
@@ -208,7 +210,7 @@ class WorkerCreateTMS_ServerXYZ(QtCore.QObject): # Obsolete, need changes!
         self.iterFeat.close()
         break
       item_id = feat['id']
-      ( ok, item_type ) = API_PlanetLabs.getValue( feat['meta_json'], [ 'item_type' ] )
+      ( ok, item_type ) = CatalogPL._getItemType( feat )
       if not ok:
         msg = "Error create TMS from {0}: {1}".format( item_id, item_type)
         self.logMessage( msg, CatalogPL.pluginName, QgsCore.QgsMessageLog.CRITICAL )
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+Name                 : Writer Files
+Description          : Write of downloads in thread, outside of event loop of QGIS
+Date                 : October, 2026
+copyright            : (C) 2015 by Luiz Motta
+email                : motta.luiz@gmail.com
+
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os, Queue, hashlib
+
+from PyQt4 import QtCore
+
+
+class WorkerWriteFiles(QtCore.QObject):
+  # Writes of downloads by messages of queue, signals received in thread of GUI
+
+  written = QtCore.pyqtSignal( int ) # Bytes written( out of queue )
+  closed = QtCore.pyqtSignal( int, bool, str ) # key, isOk, MD5( hexadecimal or empty )
+  bufferSize = 4 * 1024 * 1024
+
+  def __init__(self):
+    super( WorkerWriteFiles, self ).__init__()
+    self.queue = Queue.Queue()
+
+  def put(self, message):
+    self.queue.put( message )
+
+  @staticmethod
+  def _readDigest(digest, name, start=0, end=None):
+    # Update MD5 with the bytes of file from start until end( None: end of file ), return the last position
+    if not end is None and start >= end:
+      return start
+    with open( name, 'rb' ) as f:
+      f.seek( start )
+      while end is None or start < end:
+        size = WorkerWriteFiles.bufferSize if end is None else min( WorkerWriteFiles.bufferSize, end - start )
+        data = f.read( size )
+        if not data:
+          break
+        digest.update( data )
+        start += len( data )
+    return start
+
+  @QtCore.pyqtSlot()
+  def run(self):
+    files, digests, errors = {}, {}, set()
+    prefixes = {} # keyDigest: [ MD5, name, position ], digest of failed transfer is released by stop
+    while True:
+      message = self.queue.get()
+      ( action, key ) = ( message[0], message[1] if len( message ) > 1 else None )
+      try:
+        if action == 'stop':
+          break
+        if action == 'open':
+          ( name, mode, isDigest, offset, size ) = message[2:]
+          if isDigest:
+            isPart = mode == 'ab' and os.path.exists( name )
+            digests[ key ] = hashlib.md5()
+            if isPart:
+              WorkerWriteFiles._readDigest( digests[ key ], name )
+          files[ key ] = open( name, mode, WorkerWriteFiles.bufferSize )
+          if not size is None:
+            files[ key ].truncate( size )
+          if mode == 'r+b':
+            files[ key ].seek( offset )
+        elif action == 'write':
+          if not key in errors:
+            files[ key ].write( message[2] )
+            if key in digests:
+              digests[ key ].update( message[2] )
+          self.written.emit( len( message[2] ) )
+        elif action == 'prefix':
+          ( name, end ) = message[2:]
+          prefix = prefixes.setdefault( key, [ hashlib.md5(), name, 0 ] )
+          prefix[2] = WorkerWriteFiles._readDigest( prefix[0], name, prefix[2], end )
+        elif action == 'close':
+          f = files.pop( key, None )
+          if not f is None:
+            f.close()
+          digest = digests.pop( key, None )
+          prefix = prefixes.pop( message[2], None )
+          if not prefix is None and not key in errors:
+            WorkerWriteFiles._readDigest( prefix[0], prefix[1], prefix[2] )
+            digest = prefix[0]
+          self.closed.emit( key, not key in errors, '' if digest is None else digest.hexdigest() )
+          errors.discard( key )
+      except ( IOError, OSError ):
+        errors.add( key )
+        if action == 'write':
+          self.written.emit( len( message[2] ) )
+        elif action == 'prefix': # Next 'prefix' reads from start, 'close' without it sends empty MD5
+          prefixes.pop( key, None )
+          errors.discard( key )
+        elif action == 'close':
+          digests.pop( key, None )
+          self.closed.emit( key, False, '' )
+          errors.discard( key )
+    for f in files.itervalues():
+      f.close()